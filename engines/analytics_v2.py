@@ -6,6 +6,7 @@ Track page views, clicks, AI chat actions, cart events, and purchase flow
 
 import os
 import json
+import bisect
 from pathlib import Path
 from datetime import datetime, timedelta
 from collections import defaultdict
@@ -14,25 +15,178 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 ANALYTICS_FILE = DATA_DIR / "analytics_v2.json"
 
+# Capped streams keep their newest N events; trimming only happens once a
+# stream overshoots by TRIM_SLACK so the cost is amortized across events
+STREAM_CAPS = {"page_views": 10000, "clicks": 50000, "chat_actions": 10000}
+TRIM_SLACK = 1000
+
+EVENT_STREAMS = ("page_views", "clicks", "scroll_depth", "chat_actions", "cart_events", "purchases")
+
+# Parsed analytics file, reused until its mtime changes
+_cache = {"mtime": None, "data": None}
+# Per-stream "timestamps are chronological" flags, rebuilt lazily after each load/save
+_ts_sorted = {}
+
+# On-disk key holding the absence masks of an EventList's sparse columns
+ABSENT_KEY = "_absent"
+
+class EventList:
+    """Event stream stored column-wise ({field: [values]}) that still iterates as event dicts
+    
+    Fields missing from some events get a None placeholder in their column plus an
+    absence mask ({field: [bool]}), so rebuilt events leave those keys out.
+    """
+    
+    def __init__(self, columns=None, absent=None):
+        self.columns = columns if columns is not None else {}
+        self.absent = absent if absent is not None else {}
+        self._len = len(next(iter(self.columns.values()), []))
+    
+    @classmethod
+    def load(cls, value):
+        """Build from on-disk columns or a legacy list of event dicts"""
+        if isinstance(value, dict):
+            absent = value.pop(ABSENT_KEY, None)
+            return cls(value, absent)
+        events = cls()
+        for event in value:
+            events.append(event)
+        return events
+    
+    def to_json(self):
+        """Columns as written to disk, with the absence masks when there are any"""
+        if self.absent:
+            return {**self.columns, ABSENT_KEY: self.absent}
+        return self.columns
+    
+    def append(self, event):
+        for key in event:
+            if key not in self.columns:
+                self.columns[key] = [None] * self._len
+                if self._len:
+                    self.absent[key] = [True] * self._len
+        for key, values in self.columns.items():
+            mask = self.absent.get(key)
+            if key in event:
+                values.append(event[key])
+                if mask is not None:
+                    mask.append(False)
+            else:
+                values.append(None)
+                if mask is None:
+                    mask = self.absent[key] = [False] * self._len
+                mask.append(True)
+        self._len += 1
+    
+    def column(self, name):
+        """Values of one field, None where an event lacks it"""
+        return self.columns.get(name, [None] * self._len)
+    
+    @property
+    def pages(self):
+        return self.column("page")
+    
+    @property
+    def timestamps(self):
+        return self.column("timestamp")
+    
+    def take(self, indices):
+        return EventList(
+            {key: [values[i] for i in indices] for key, values in self.columns.items()},
+            {key: [mask[i] for i in indices] for key, mask in self.absent.items()}
+        )
+    
+    def _row(self, keys, row, masks, index):
+        return {key: value for key, value, mask in zip(keys, row, masks) if mask is None or not mask[index]}
+    
+    def __len__(self):
+        return self._len
+    
+    def __iter__(self):
+        keys = list(self.columns)
+        if not self.absent:
+            for row in zip(*self.columns.values()):
+                yield dict(zip(keys, row))
+            return
+        masks = [self.absent.get(key) for key in keys]
+        for index, row in enumerate(zip(*self.columns.values())):
+            yield self._row(keys, row, masks, index)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EventList(
+                {key: values[index] for key, values in self.columns.items()},
+                {key: mask[index] for key, mask in self.absent.items()}
+            )
+        keys = list(self.columns)
+        row = [values[index] for values in self.columns.values()]
+        return self._row(keys, row, [self.absent.get(key) for key in keys], index)
+    
+    def __delitem__(self, index):
+        for values in self.columns.values():
+            del values[index]
+        for mask in self.absent.values():
+            del mask[index]
+        self._len = len(next(iter(self.columns.values()), []))
+
 def load_analytics():
     """Load analytics data"""
     if ANALYTICS_FILE.exists():
-        with open(ANALYTICS_FILE, "r") as f:
-            return json.load(f)
+        mtime = ANALYTICS_FILE.stat().st_mtime_ns
+        if _cache["mtime"] != mtime:
+            with open(ANALYTICS_FILE, "r") as f:
+                data = json.load(f)
+            for stream in EVENT_STREAMS:
+                if stream in data:
+                    data[stream] = EventList.load(data[stream])
+            _cache["data"] = data
+            _cache["mtime"] = mtime
+            _ts_sorted.clear()
+        return _cache["data"]
     return {
-        "page_views": [],
-        "clicks": [],
-        "chat_actions": [],
-        "cart_events": [],
-        "purchases": [],
+        "page_views": EventList(),
+        "clicks": EventList(),
+        "chat_actions": EventList(),
+        "cart_events": EventList(),
+        "purchases": EventList(),
         "sessions": {}
     }
 
 def save_analytics(data):
     """Save analytics data"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
+    serialized = {k: (v.to_json() if isinstance(v, EventList) else v) for k, v in data.items()}
     with open(ANALYTICS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+        json.dump(serialized, f, separators=(",", ":"))
+    _cache["data"] = data
+    _cache["mtime"] = ANALYTICS_FILE.stat().st_mtime_ns
+    _ts_sorted.clear()
+
+def trim_stream(data, stream):
+    """Drop the oldest events of a capped stream in place"""
+    cap = STREAM_CAPS[stream]
+    events = data[stream]
+    if len(events) > cap + TRIM_SLACK:
+        del events[:-cap]
+
+def recent_events(data, stream, cutoff_iso):
+    """Events of a stream with a timestamp after cutoff_iso
+    
+    Events are appended chronologically, so the start index is found by
+    bisecting the stream's timestamp column instead of parsing every event.
+    """
+    events = data.get(stream) or EventList()
+    timestamps = events.timestamps
+    
+    is_sorted = _ts_sorted.get(stream) if data is _cache["data"] else None
+    if is_sorted is None:
+        is_sorted = all(a <= b for a, b in zip(timestamps, timestamps[1:]))
+        if data is _cache["data"]:
+            _ts_sorted[stream] = is_sorted
+    
+    if is_sorted:
+        return events[bisect.bisect_right(timestamps, cutoff_iso):]
+    return events.take([i for i, ts in enumerate(timestamps) if ts > cutoff_iso])
 
 def track_page_view(page, user_id=None, session_id=None, referrer=None):
     """Track a page view"""
@@ -48,8 +202,7 @@ def track_page_view(page, user_id=None, session_id=None, referrer=None):
     
     data["page_views"].append(event)
     
-    if len(data["page_views"]) > 10000:
-        data["page_views"] = data["page_views"][-10000:]
+    trim_stream(data, "page_views")
     
     save_analytics(data)
     return event
@@ -69,8 +222,7 @@ def track_click(element, page, coords=None, user_id=None, session_id=None):
     
     data["clicks"].append(event)
     
-    if len(data["clicks"]) > 50000:
-        data["clicks"] = data["clicks"][-50000:]
+    trim_stream(data, "clicks")
     
     save_analytics(data)
     return event
@@ -80,7 +232,7 @@ def track_scroll_depth(page, depth, user_id=None, session_id=None):
     data = load_analytics()
     
     if "scroll_depth" not in data:
-        data["scroll_depth"] = []
+        data["scroll_depth"] = EventList()
     
     event = {
         "page": page,
@@ -109,8 +261,7 @@ def track_chat_action(action, query, response=None, user_id=None, session_id=Non
     
     data["chat_actions"].append(event)
     
-    if len(data["chat_actions"]) > 10000:
-        data["chat_actions"] = data["chat_actions"][-10000:]
+    trim_stream(data, "chat_actions")
     
     save_analytics(data)
     return event
@@ -152,18 +303,16 @@ def track_purchase(order_id, products, total, user_id=None, session_id=None):
 def get_page_view_stats(days=7):
     """Get page view statistics"""
     data = load_analytics()
-    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
     
-    views = [v for v in data.get("page_views", []) 
-             if datetime.fromisoformat(v["timestamp"]) > cutoff]
+    views = recent_events(data, "page_views", cutoff_iso)
     
     by_page = defaultdict(int)
     by_day = defaultdict(int)
     
-    for view in views:
-        by_page[view["page"]] += 1
-        day = view["timestamp"][:10]
-        by_day[day] += 1
+    for page, timestamp in zip(views.pages, views.timestamps):
+        by_page[page] += 1
+        by_day[timestamp[:10]] += 1
     
     return {
         "total_views": len(views),
@@ -174,11 +323,10 @@ def get_page_view_stats(days=7):
 def get_heatmap_data(page, days=7):
     """Get click heatmap data for a page"""
     data = load_analytics()
-    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
     
-    clicks = [c for c in data.get("clicks", [])
-              if c["page"] == page and c.get("coords") and
-              datetime.fromisoformat(c["timestamp"]) > cutoff]
+    clicks = [c for c in recent_events(data, "clicks", cutoff_iso)
+              if c["page"] == page and c.get("coords")]
     
     return {
         "page": page,
@@ -189,14 +337,12 @@ def get_heatmap_data(page, days=7):
 def get_scroll_depth_stats(page=None, days=7):
     """Get scroll depth statistics"""
     data = load_analytics()
-    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
     
-    depths = data.get("scroll_depth", [])
+    depths = recent_events(data, "scroll_depth", cutoff_iso)
     if page:
         depths = [d for d in depths if d["page"] == page]
     
-    depths = [d for d in depths if datetime.fromisoformat(d["timestamp"]) > cutoff]
-    
     depth_buckets = {25: 0, 50: 0, 75: 0, 100: 0}
     for d in depths:
         depth = d.get("depth", 0)
@@ -212,10 +358,9 @@ def get_scroll_depth_stats(page=None, days=7):
 def get_intent_clusters(days=7):
     """Analyze chat intent clusters"""
     data = load_analytics()
-    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
     
-    actions = [a for a in data.get("chat_actions", [])
-               if datetime.fromisoformat(a["timestamp"]) > cutoff]
+    actions = recent_events(data, "chat_actions", cutoff_iso)
     
     intents = defaultdict(int)
     for action in actions:
@@ -230,25 +375,26 @@ def get_intent_clusters(days=7):
 def get_conversion_funnel(days=7):
     """Get conversion funnel data"""
     data = load_analytics()
-    cutoff = datetime.now() - timedelta(days=days)
-    
-    page_views = len([v for v in data.get("page_views", [])
-                      if datetime.fromisoformat(v["timestamp"]) > cutoff])
+    cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
     
-    product_views = len([v for v in data.get("page_views", [])
-                         if "/products/" in v["page"] and
-                         datetime.fromisoformat(v["timestamp"]) > cutoff])
+    views = recent_events(data, "page_views", cutoff_iso)
+    page_views = len(views)
     
-    cart_adds = len([e for e in data.get("cart_events", [])
-                     if e["type"] == "add" and
-                     datetime.fromisoformat(e["timestamp"]) > cutoff])
+    # One pass over the page column; a page can count as both a product view and a checkout
+    product_views = 0
+    checkouts = 0
+    for page in views.pages:
+        if page is None:
+            continue
+        if "/products/" in page:
+            product_views += 1
+        if "/checkout" in page:
+            checkouts += 1
     
-    checkouts = len([v for v in data.get("page_views", [])
-                     if "/checkout" in v["page"] and
-                     datetime.fromisoformat(v["timestamp"]) > cutoff])
+    cart_adds = len([e for e in recent_events(data, "cart_events", cutoff_iso)
+                     if e["type"] == "add"])
     
-    purchases = len([p for p in data.get("purchases", [])
-                     if datetime.fromisoformat(p["timestamp"]) > cutoff])
+    purchases = len(recent_events(data, "purchases", cutoff_iso))
     
     return {
         "funnel": {
@@ -270,25 +416,23 @@ def get_conversion_funnel(days=7):
 def get_chat_to_cart_funnel(days=7):
     """Get chat-to-cart conversion funnel"""
     data = load_analytics()
-    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_iso = (datetime.now() - timedelta(days=days)).isoformat()
     
     chat_sessions = set()
     chat_add_intents = set()
     
-    for action in data.get("chat_actions", []):
-        if datetime.fromisoformat(action["timestamp"]) > cutoff:
-            session = action.get("session_id")
-            if session:
-                chat_sessions.add(session)
-                if action.get("action") == "add":
-                    chat_add_intents.add(session)
+    for action in recent_events(data, "chat_actions", cutoff_iso):
+        session = action.get("session_id")
+        if session:
+            chat_sessions.add(session)
+            if action.get("action") == "add":
+                chat_add_intents.add(session)
     
     cart_sessions = set()
-    for event in data.get("cart_events", []):
-        if datetime.fromisoformat(event["timestamp"]) > cutoff:
-            session = event.get("session_id")
-            if session and event["type"] == "add":
-                cart_sessions.add(session)
+    for event in recent_events(data, "cart_events", cutoff_iso):
+        session = event.get("session_id")
+        if session and event["type"] == "add":
+            cart_sessions.add(session)
     
     chat_to_cart = chat_add_intents & cart_sessions
     
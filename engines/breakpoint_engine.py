@@ -4,6 +4,7 @@ Breakpoint Engine - Creates hero breakpoints for all screen sizes
 """
 import os
 import json
+import atexit
 from datetime import datetime
 
 LOG_FILE = "logs/breakpoints.log"
@@ -26,12 +27,17 @@ def ensure_dirs():
     os.makedirs("config", exist_ok=True)
     os.makedirs(HERO_DIR, exist_ok=True)
 
+_LOG_FP = None
+
 def log(message):
-    ensure_dirs()
+    global _LOG_FP
+    if _LOG_FP is None:
+        ensure_dirs()
+        _LOG_FP = open(LOG_FILE, "a", buffering=1 << 14)
+        atexit.register(_LOG_FP.close)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}\n"
-    with open(LOG_FILE, "a") as f:
-        f.write(log_entry)
+    _LOG_FP.write(log_entry)
     print(log_entry.strip())
 
 def calculate_crop(source_width, source_height, target_width, target_height):
@@ -58,25 +64,18 @@ def calculate_crop(source_width, source_height, target_width, target_height):
         "target_height": target_height
     }
 
-def generate_breakpoint_config():
-    log("Generating breakpoint configuration...")
-    
-    config = {
-        "version": "1.0.0",
-        "generated": datetime.now().isoformat(),
-        "breakpoints": []
-    }
-    
-    source_width = 1920
-    source_height = 1080
-    
+SOURCE_WIDTH = 1920
+SOURCE_HEIGHT = 1080
+
+def _build_breakpoint_configs():
+    breakpoint_configs = []
     for bp in BREAKPOINTS:
         crop_info = calculate_crop(
-            source_width, source_height,
+            SOURCE_WIDTH, SOURCE_HEIGHT,
             bp["width"], bp["height"]
         )
         
-        breakpoint_config = {
+        breakpoint_configs.append({
             "name": bp["name"],
             "width": bp["width"],
             "height": bp["height"],
@@ -84,19 +83,10 @@ def generate_breakpoint_config():
             "css_query": f"@media (max-width: {bp['width']}px)",
             "crop": crop_info,
             "filename": f"hero-{bp['name']}-{bp['width']}x{bp['height']}.jpg"
-        }
-        
-        config["breakpoints"].append(breakpoint_config)
-        log(f"Generated config for {bp['name']}: {bp['width']}x{bp['height']}")
-    
-    return config
-
-def save_config(config):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(config, f, indent=2)
-    log(f"Configuration saved to {CONFIG_FILE}")
+        })
+    return breakpoint_configs
 
-def generate_css_media_queries(config):
+def _build_css(breakpoints):
     css = """
 /* Hero Responsive Breakpoints - Auto-generated */
 .hero-section {
@@ -113,7 +103,7 @@ def generate_css_media_queries(config):
 
 """
     
-    sorted_breakpoints = sorted(config["breakpoints"], key=lambda x: x["width"], reverse=True)
+    sorted_breakpoints = sorted(breakpoints, key=lambda x: x["width"], reverse=True)
     
     for bp in sorted_breakpoints:
         css += f"""
@@ -127,6 +117,41 @@ def generate_css_media_queries(config):
     
     return css
 
+def _css_key(breakpoints):
+    """The breakpoint fields _build_css reads, as a hashable value"""
+    return tuple((bp["name"], bp["width"], bp["height"]) for bp in breakpoints)
+
+# BREAKPOINTS and the source resolution are static, so crops and CSS are built once at import;
+# callers get copies, and the CSS is reused only when their breakpoints still match by value
+_BREAKPOINT_CONFIGS = _build_breakpoint_configs()
+_CSS_KEY = _css_key(_BREAKPOINT_CONFIGS)
+_CSS = _build_css(_BREAKPOINT_CONFIGS)
+
+def generate_breakpoint_config():
+    log("Generating breakpoint configuration...")
+    
+    breakpoints = [{**bp, "crop": dict(bp["crop"])} for bp in _BREAKPOINT_CONFIGS]
+    config = {
+        "version": "1.0.0",
+        "generated": datetime.now().isoformat(),
+        "breakpoints": breakpoints
+    }
+    
+    for bp in breakpoints:
+        log(f"Generated config for {bp['name']}: {bp['width']}x{bp['height']}")
+    
+    return config
+
+def save_config(config):
+    with open(CONFIG_FILE, "w") as f:
+        json.dump(config, f, indent=2)
+    log(f"Configuration saved to {CONFIG_FILE}")
+
+def generate_css_media_queries(config):
+    if _css_key(config["breakpoints"]) == _CSS_KEY:
+        return _CSS
+    return _build_css(config["breakpoints"])
+
 def run_breakpoint_engine():
     log("=== Breakpoint Engine Started ===")
     
@@ -141,6 +166,7 @@ def run_breakpoint_engine():
     log(f"CSS media queries saved to {css_file}")
     
     log(f"=== Breakpoint Engine Complete: {len(config['breakpoints'])} breakpoints configured ===")
+    _LOG_FP.flush()
     
     return {
         "breakpoints_count": len(config["breakpoints"]),
@@ -6,14 +6,30 @@ Generate category pages with AI-powered content
 
 import os
 import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 CATEGORIES_FILE = DATA_DIR / "categories.json"
 PRODUCTS_FILE = DATA_DIR / "products_v5.json"
+CATEGORY_AI_WORKERS = int(os.environ.get("CATEGORY_AI_WORKERS", "8"))
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Shared session so the TLS connection to OpenAI is kept alive between calls
+_SESSION = requests.Session()
+_SESSION.headers.update({"Content-Type": "application/json"})
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2)))
+
+# Serializes the load/modify/save of categories.json across worker threads
+_CATEGORIES_LOCK = threading.Lock()
+# categories.json document plus id -> list positions, reused until its mtime changes
+_categories_cache = {"mtime": None, "data": None, "index": None}
 
 def get_openai_key():
     return os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
@@ -33,26 +49,88 @@ def load_categories():
             return json.load(f)
     return {"categories": []}
 
+def _categories_mtime():
+    return CATEGORIES_FILE.stat().st_mtime_ns if CATEGORIES_FILE.exists() else None
+
+def _index_categories(data):
+    """Map each category id to its positions in the list; entries without an id are left out"""
+    index = {}
+    for i, c in enumerate(data.get("categories", [])):
+        category_id = c.get("id")
+        if category_id is not None:
+            index.setdefault(category_id, []).append(i)
+    return index
+
+def _load_indexed():
+    """Return the categories document and its id index, re-reading the file when it changed"""
+    mtime = _categories_mtime()
+    if _categories_cache["data"] is None or _categories_cache["mtime"] != mtime:
+        data = load_categories()
+        _categories_cache["data"] = data
+        _categories_cache["index"] = _index_categories(data)
+        _categories_cache["mtime"] = mtime
+    return _categories_cache["data"], _categories_cache["index"]
+
+def upsert_category(category_data):
+    """Replace the categories sharing category_data's id, or append it, then save"""
+    data, index = _load_indexed()
+    categories = data.setdefault("categories", [])
+    positions = index.get(category_data["id"])
+    if positions:
+        for i in positions:
+            categories[i] = category_data
+    else:
+        index[category_data["id"]] = [len(categories)]
+        categories.append(category_data)
+    
+    data["updated_at"] = datetime.now().isoformat()
+    save_categories(data)
+
 def save_categories(data):
     """Save categories to JSON"""
     with open(CATEGORIES_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+        json.dump(data, f, separators=(",", ":"))
+    
+    if data is not _categories_cache["data"]:
+        _categories_cache["data"] = data
+        _categories_cache["index"] = _index_categories(data)
+    _categories_cache["mtime"] = _categories_mtime()
 
 def get_products_in_category(category_name):
     """Get all products in a category"""
     products = load_products()
     return [p for p in products if p.get("category", "").lower() == category_name.lower()]
 
-def generate_category_content(category_name):
-    """Generate AI-powered category content"""
-    api_key = get_openai_key()
-    products = get_products_in_category(category_name)
+def get_category_summary(category_name):
+    """Filter a category's products and collect names and price range in one pass"""
+    category_lower = category_name.lower()
+    products = []
+    product_names = []
+    price_min = None
+    price_max = None
+    
+    for p in load_products():
+        if p.get("category", "").lower() != category_lower:
+            continue
+        products.append(p)
+        if len(product_names) < 10:
+            product_names.append(p.get("name", ""))
+        price = p.get("price", 0)
+        if price_min is None or price < price_min:
+            price_min = price
+        if price_max is None or price > price_max:
+            price_max = price
     
-    product_names = [p.get("name", "") for p in products[:10]]
     price_range = {
-        "min": min([p.get("price", 0) for p in products]) if products else 0,
-        "max": max([p.get("price", 0) for p in products]) if products else 0
+        "min": price_min if products else 0,
+        "max": price_max if products else 0
     }
+    return products, product_names, price_range
+
+def generate_category_content(category_name, summary=None):
+    """Generate AI-powered category content"""
+    api_key = get_openai_key()
+    products, product_names, price_range = summary or get_category_summary(category_name)
     
     if not api_key:
         return generate_fallback_category(category_name, products, price_range)
@@ -77,12 +155,9 @@ Generate JSON with:
 - banner_color: Hex color for category banner
 - icon_emoji: Single emoji representing the category"""
 
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            },
+        response = _SESSION.post(
+            OPENAI_CHAT_URL,
+            headers={"Authorization": f"Bearer {api_key}"},
             json={
                 "model": "gpt-4o-mini",
                 "messages": [
@@ -127,8 +202,9 @@ def generate_category(category_name):
     """Generate and save a category"""
     print(f"Generating category: {category_name}")
     
-    content = generate_category_content(category_name)
-    products = get_products_in_category(category_name)
+    summary = get_category_summary(category_name)
+    products, _, price_range = summary
+    content = generate_category_content(category_name, summary)
     
     category_data = {
         "id": category_name.lower().replace(" ", "-"),
@@ -136,26 +212,12 @@ def generate_category(category_name):
         "slug": category_name.lower().replace(" ", "-"),
         **content,
         "product_count": len(products),
-        "price_range": {
-            "min": min([p.get("price", 0) for p in products]) if products else 0,
-            "max": max([p.get("price", 0) for p in products]) if products else 0
-        },
+        "price_range": dict(price_range),
         "generated_at": datetime.now().isoformat()
     }
     
-    categories = load_categories()
-    existing_ids = [c.get("id") for c in categories.get("categories", [])]
-    
-    if category_data["id"] in existing_ids:
-        categories["categories"] = [
-            category_data if c.get("id") == category_data["id"] else c
-            for c in categories.get("categories", [])
-        ]
-    else:
-        categories.setdefault("categories", []).append(category_data)
-    
-    categories["updated_at"] = datetime.now().isoformat()
-    save_categories(categories)
+    with _CATEGORIES_LOCK:
+        upsert_category(category_data)
     
     print(f"Category '{category_name}' generated successfully")
     return category_data
@@ -173,9 +235,13 @@ def generate_all_categories():
     print(f"Found {len(category_names)} categories to generate")
     
     results = []
-    for cat_name in category_names:
-        result = generate_category(cat_name)
-        results.append(result)
+    with ThreadPoolExecutor(max_workers=CATEGORY_AI_WORKERS) as executor:
+        futures = {executor.submit(generate_category, cat_name): cat_name for cat_name in category_names}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Category '{futures[future]}' failed: {e}")
     
     return results
 
@@ -6,48 +6,113 @@ WebSocket-based real-time chat with personalization
 
 import os
 import json
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from datetime import datetime
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 PRODUCTS_FILE = DATA_DIR / "products_v5.json"
-CHAT_MEMORY_FILE = DATA_DIR / "chat_memory.json"
+CHAT_MEMORY_DIR = DATA_DIR / "chat_memory"
+# Single-file store used before memory was sharded per session; split up on first use
+LEGACY_CHAT_MEMORY_FILE = DATA_DIR / "chat_memory.json"
 USER_PROFILES_FILE = DATA_DIR / "user_profiles.json"
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Shared session so the TLS connection to OpenAI is kept alive between calls
+_SESSION = requests.Session()
+_SESSION.headers.update({"Content-Type": "application/json"})
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2)))
 
 def get_openai_key():
     return os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
 
+# Parsed products plus lowercased search fields, reused until the file's mtime changes
+_products_cache = {"mtime": None, "products": [], "search_index": []}
+
+def _refresh_products_cache():
+    if not PRODUCTS_FILE.exists():
+        _products_cache.update(mtime=None, products=[], search_index=[])
+        return _products_cache
+    
+    mtime = PRODUCTS_FILE.stat().st_mtime_ns
+    if _products_cache["mtime"] != mtime:
+        with open(PRODUCTS_FILE, "r") as f:
+            products = json.load(f).get("products", [])
+        _products_cache["products"] = products
+        _products_cache["search_index"] = [
+            (
+                product,
+                product.get("name", "").lower(),
+                product.get("description", "").lower(),
+                frozenset(t.lower() for t in product.get("tags", []))
+            )
+            for product in products
+        ]
+        _products_cache["mtime"] = mtime
+    return _products_cache
+
 def load_products():
     """Load all products"""
-    if PRODUCTS_FILE.exists():
-        with open(PRODUCTS_FILE, "r") as f:
+    return _refresh_products_cache()["products"]
+
+def session_memory_file(session_id):
+    """Per-session chat memory file, named by a digest of the id so distinct ids never share a file"""
+    digest = hashlib.sha256(str(session_id).encode()).hexdigest()
+    return CHAT_MEMORY_DIR / f"{digest}.json"
+
+def write_session_memory(memory_file, memory):
+    tmp_file = memory_file.with_suffix(f".json.{os.getpid()}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(memory, f, separators=(",", ":"))
+    os.replace(tmp_file, memory_file)
+
+_legacy_migrated = False
+
+def migrate_legacy_chat_memory():
+    """Split the old chat_memory.json into per-session files (once), then rename it to .migrated
+    
+    Sessions that already have their own file keep it.
+    """
+    global _legacy_migrated
+    if _legacy_migrated:
+        return
+    _legacy_migrated = True
+    if not LEGACY_CHAT_MEMORY_FILE.exists():
+        return
+    
+    try:
+        with open(LEGACY_CHAT_MEMORY_FILE, "r") as f:
             data = json.load(f)
-            return data.get("products", [])
-    return []
+        CHAT_MEMORY_DIR.mkdir(parents=True, exist_ok=True)
+        for session_id, memory in data.items():
+            memory_file = session_memory_file(session_id)
+            if not memory_file.exists():
+                write_session_memory(memory_file, memory)
+        os.replace(LEGACY_CHAT_MEMORY_FILE, LEGACY_CHAT_MEMORY_FILE.with_suffix(".json.migrated"))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"Error migrating {LEGACY_CHAT_MEMORY_FILE}: {e}")
 
 def load_chat_memory(session_id):
     """Load chat memory for a session"""
-    if CHAT_MEMORY_FILE.exists():
-        with open(CHAT_MEMORY_FILE, "r") as f:
-            data = json.load(f)
-            return data.get(session_id, {"messages": [], "context": {}})
+    migrate_legacy_chat_memory()
+    memory_file = session_memory_file(session_id)
+    if memory_file.exists():
+        with open(memory_file, "r") as f:
+            return json.load(f)
     return {"messages": [], "context": {}}
 
 def save_chat_memory(session_id, memory):
     """Save chat memory for a session"""
-    if CHAT_MEMORY_FILE.exists():
-        with open(CHAT_MEMORY_FILE, "r") as f:
-            data = json.load(f)
-    else:
-        data = {}
-    
-    data[session_id] = memory
-    data[session_id]["updated_at"] = datetime.now().isoformat()
-    
-    with open(CHAT_MEMORY_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    migrate_legacy_chat_memory()
+    CHAT_MEMORY_DIR.mkdir(parents=True, exist_ok=True)
+    memory["updated_at"] = datetime.now().isoformat()
+    write_session_memory(session_memory_file(session_id), memory)
 
 def load_user_profile(user_id):
     """Load user profile for personalization"""
@@ -59,23 +124,17 @@ def load_user_profile(user_id):
 
 def search_products_realtime(query, limit=5):
     """Fast product search for real-time responses"""
-    products = load_products()
+    search_index = _refresh_products_cache()["search_index"]
     query_lower = query.lower()
-    words = query_lower.split()
+    words = [word for word in query_lower.split() if len(word) >= 3]
     
     scored = []
-    for product in products:
+    for product, name_lower, desc_lower, tags in search_index:
         if not product.get("published", True):
             continue
         
         score = 0
-        name_lower = product.get("name", "").lower()
-        desc_lower = product.get("description", "").lower()
-        tags = [t.lower() for t in product.get("tags", [])]
-        
         for word in words:
-            if len(word) < 3:
-                continue
             if word in name_lower:
                 score += 10
             if word in desc_lower:
@@ -101,10 +160,8 @@ def get_product_reviews_quote(product_id):
                 return f"'{best.get('text', '')}' - {best.get('author', 'Customer')}"
     return None
 
-def generate_personalized_response(message, session_id, user_id=None):
-    """Generate a personalized AI response"""
-    api_key = get_openai_key()
-    
+def build_chat_context(message, session_id, user_id=None):
+    """Collect memory, matching products and the OpenAI message list for a chat turn"""
     memory = load_chat_memory(session_id)
     user_profile = load_user_profile(user_id) if user_id else {}
     
@@ -123,6 +180,39 @@ def generate_personalized_response(message, session_id, user_id=None):
     
     history = memory.get("messages", [])[-6:]
     
+    messages = [
+        {
+            "role": "system",
+            "content": f"""You are Pawsy, a friendly and helpful AI assistant for GetPawsy pet store.
+Be enthusiastic, use pet-related puns, and be genuinely helpful.
+Always try to recommend relevant products when appropriate.
+Keep responses concise but warm.{user_context}{product_context}"""
+        }
+    ]
+    
+    for h in history:
+        messages.append({"role": h.get("role", "user"), "content": h.get("content", "")})
+    
+    messages.append({"role": "user", "content": message})
+    
+    return memory, products, product_context, messages
+
+def remember_exchange(session_id, memory, message, ai_response):
+    """Append a user/assistant exchange to the session memory and save it"""
+    memory["messages"].append({"role": "user", "content": message})
+    memory["messages"].append({"role": "assistant", "content": ai_response})
+    
+    if len(memory["messages"]) > 20:
+        memory["messages"] = memory["messages"][-20:]
+    
+    save_chat_memory(session_id, memory)
+
+def generate_personalized_response(message, session_id, user_id=None):
+    """Generate a personalized AI response"""
+    api_key = get_openai_key()
+    
+    memory, products, product_context, messages = build_chat_context(message, session_id, user_id)
+    
     if not api_key:
         return {
             "response": f"Woof! I'd love to help you find the perfect pet products! {product_context}",
@@ -131,27 +221,9 @@ def generate_personalized_response(message, session_id, user_id=None):
         }
     
     try:
-        messages = [
-            {
-                "role": "system",
-                "content": f"""You are Pawsy, a friendly and helpful AI assistant for GetPawsy pet store.
-Be enthusiastic, use pet-related puns, and be genuinely helpful.
-Always try to recommend relevant products when appropriate.
-Keep responses concise but warm.{user_context}{product_context}"""
-            }
-        ]
-        
-        for h in history:
-            messages.append({"role": h.get("role", "user"), "content": h.get("content", "")})
-        
-        messages.append({"role": "user", "content": message})
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            },
+        response = _SESSION.post(
+            OPENAI_CHAT_URL,
+            headers={"Authorization": f"Bearer {api_key}"},
             json={
                 "model": "gpt-4o-mini",
                 "messages": messages,
@@ -164,13 +236,7 @@ Keep responses concise but warm.{user_context}{product_context}"""
         if response.status_code == 200:
             ai_response = response.json()["choices"][0]["message"]["content"]
             
-            memory["messages"].append({"role": "user", "content": message})
-            memory["messages"].append({"role": "assistant", "content": ai_response})
-            
-            if len(memory["messages"]) > 20:
-                memory["messages"] = memory["messages"][-20:]
-            
-            save_chat_memory(session_id, memory)
+            remember_exchange(session_id, memory, message, ai_response)
             
             return {
                 "response": ai_response,
@@ -187,6 +253,82 @@ Keep responses concise but warm.{user_context}{product_context}"""
         "suggestions": ["Browse products", "Contact support"]
     }
 
+def generate_personalized_response_stream(message, session_id, user_id=None):
+    """Stream a personalized AI response as it is generated
+    
+    Yields {"type": "delta", "content": ...} events for each token chunk,
+    followed by one {"type": "done", ...} event carrying the same fields
+    as generate_personalized_response.
+    """
+    api_key = get_openai_key()
+    
+    memory, products, product_context, messages = build_chat_context(message, session_id, user_id)
+    
+    if not api_key:
+        text = f"Woof! I'd love to help you find the perfect pet products! {product_context}"
+        yield {"type": "delta", "content": text}
+        yield {
+            "type": "done",
+            "response": text,
+            "products": products[:3],
+            "suggestions": ["Browse dog toys", "See cat beds", "View bestsellers"]
+        }
+        return
+    
+    chunks = []
+    try:
+        with _SESSION.post(
+            OPENAI_CHAT_URL,
+            headers={"Authorization": f"Bearer {api_key}"},
+            json={
+                "model": "gpt-4o-mini",
+                "messages": messages,
+                "temperature": 0.8,
+                "max_tokens": 300,
+                "stream": True
+            },
+            timeout=15,
+            stream=True
+        ) as response:
+            if response.status_code == 200:
+                for raw_line in response.iter_lines():
+                    line = raw_line.decode("utf-8")
+                    if not line.startswith("data: "):
+                        continue
+                    payload = line[len("data: "):]
+                    if payload == "[DONE]":
+                        break
+                    choices = json.loads(payload).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        chunks.append(content)
+                        yield {"type": "delta", "content": content}
+                
+                if chunks:
+                    ai_response = "".join(chunks)
+                    remember_exchange(session_id, memory, message, ai_response)
+                    
+                    yield {
+                        "type": "done",
+                        "response": ai_response,
+                        "products": products[:3] if products else [],
+                        "suggestions": generate_suggestions(message, products)
+                    }
+                    return
+            
+    except Exception as e:
+        print(f"Chat AI stream error: {e}")
+    
+    fallback = "Woof! I hit a little snag, but I'm still here to help! 🐾"
+    if not chunks:
+        yield {"type": "delta", "content": fallback}
+    yield {
+        "type": "done",
+        "response": "".join(chunks) or fallback,
+        "products": products[:3] if products else [],
+        "suggestions": ["Browse products", "Contact support"]
+    }
+
 def generate_suggestions(message, products):
     """Generate follow-up suggestions"""
     suggestions = []
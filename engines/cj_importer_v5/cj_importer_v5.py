@@ -8,31 +8,115 @@ import os
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import hashlib
+import zlib
 import time
+import itertools
+import shelve
+import dbm
+import atexit
+import threading
+import asyncio
 from datetime import datetime
 from pathlib import Path
 
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from ..json_io import json_loads, json_dumps, write_file_atomic
+except ImportError:
+    # Run as a script from its own directory: the shared helpers live one level up
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from json_io import json_loads, json_dumps, write_file_atomic
+
+try:
+    from .fast_http import (
+        download_many, fetch_json_many, AuthError, HAS_AIOHTTP, MAX_IMAGE_BYTES, CHUNK_SIZE
+    )
+except ImportError:
+    from fast_http import (
+        download_many, fetch_json_many, AuthError, HAS_AIOHTTP, MAX_IMAGE_BYTES, CHUNK_SIZE
+    )
+
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = BASE_DIR / "data"
 PRODUCTS_FILE = DATA_DIR / "products_v5.json"
+BUNDLES_FILE = DATA_DIR / "bundles_v5.json"
 IMAGES_DIR = BASE_DIR / "public" / "images" / "products"
+SEO_CACHE_FILE = DATA_DIR / "seo_cache.db"
+CJ_TOKEN_FILE = DATA_DIR / ".cj_token.json"
+CJ_TOKEN_TTL = 23 * 3600
+# CJ error code for an invalid or expired access token (sent with HTTP 200)
+CJ_AUTH_ERROR_CODES = {1600001}
+IMAGE_DOWNLOAD_WORKERS = 8
+CJ_PAGE_SIZE = 50
+CJ_PAGE_CONCURRENCY = 8
 
 CJ_API_BASE = "https://developers.cjdropshipping.com/api2.0/v1"
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Shared session so CJ, image and OpenAI requests reuse keep-alive connections
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
 
 def get_cj_credentials():
     app_id = os.environ.get("CJ_APPID", "")
     app_secret = os.environ.get("CJ_APPSECRET", "")
     return app_id, app_secret
 
-def get_cj_access_token():
+def cj_credentials_id(app_id):
+    """Digest of the CJ account id, stored with the token so a credential change invalidates it"""
+    return hashlib.sha256(app_id.encode()).hexdigest()
+
+def load_cached_cj_token(app_id):
+    """Return the cached CJ access token if it was issued for app_id and is still within its TTL"""
+    try:
+        with open(CJ_TOKEN_FILE, "r") as f:
+            cached = json.load(f)
+        if (cached.get("token") and cached.get("account") == cj_credentials_id(app_id)
+                and time.time() - cached.get("ts", 0) < CJ_TOKEN_TTL):
+            return cached["token"]
+    except (OSError, ValueError):
+        pass
+    return None
+
+def save_cached_cj_token(token, app_id):
+    """Persist the CJ access token (owner-only permissions, atomic replace)"""
+    try:
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = CJ_TOKEN_FILE.with_suffix(".json.tmp")
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"token": token, "ts": time.time(), "account": cj_credentials_id(app_id)}, f)
+        os.replace(tmp_file, CJ_TOKEN_FILE)
+    except OSError as e:
+        print(f"Error caching CJ access token: {e}")
+
+def clear_cached_cj_token():
+    """Forget the cached CJ access token after CJ has rejected it"""
+    try:
+        CJ_TOKEN_FILE.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Error removing cached CJ access token: {e}")
+
+def get_cj_access_token(refresh=False):
+    """Return a CJ access token, from the cache unless refresh is set"""
     app_id, app_secret = get_cj_credentials()
     if not app_id or not app_secret:
         print("WARNING: CJ API credentials not found. Using demo mode.")
         return None
     
+    if refresh:
+        clear_cached_cj_token()
+    else:
+        cached_token = load_cached_cj_token(app_id)
+        if cached_token:
+            return cached_token
+    
     try:
-        response = requests.post(
+        response = _SESSION.post(
             f"{CJ_API_BASE}/authentication/getAccessToken",
             json={"email": app_id, "password": app_secret},
             timeout=30
@@ -40,11 +124,18 @@ def get_cj_access_token():
         if response.status_code == 200:
             data = response.json()
             if data.get("result") and data.get("data"):
-                return data["data"].get("accessToken")
+                token = data["data"].get("accessToken")
+                if token:
+                    save_cached_cj_token(token, app_id)
+                return token
     except Exception as e:
         print(f"Error getting CJ access token: {e}")
     return None
 
+def is_cj_auth_error(data):
+    """True when a CJ response body reports an invalid or expired access token"""
+    return bool(data) and not data.get("result") and data.get("code") in CJ_AUTH_ERROR_CODES
+
 def calculate_markup_price(cost_price):
     """Apply markup rules and round to .99"""
     if cost_price < 10:
@@ -58,54 +149,253 @@ def calculate_markup_price(cost_price):
     final_price = int(final_price) + 0.99
     return round(final_price, 2)
 
+def image_target(image_url, product_id, index=0):
+    """Local file path and public URL for a product image"""
+    product_dir = IMAGES_DIR / product_id
+    product_dir.mkdir(parents=True, exist_ok=True)
+    
+    ext = image_url.split(".")[-1].split("?")[0][:4]
+    if ext not in ["jpg", "jpeg", "png", "webp", "gif"]:
+        ext = "jpg"
+    
+    filename = f"image_{index}.{ext}"
+    return product_dir / filename, f"/public/images/products/{product_id}/{filename}"
+
 def download_product_image(image_url, product_id, index=0):
     """Download product image to local storage"""
     if not image_url:
         return "/public/images/placeholder.png"
     
     try:
-        product_dir = IMAGES_DIR / product_id
-        product_dir.mkdir(parents=True, exist_ok=True)
-        
-        ext = image_url.split(".")[-1].split("?")[0][:4]
-        if ext not in ["jpg", "jpeg", "png", "webp", "gif"]:
-            ext = "jpg"
+        filepath, local_url = image_target(image_url, product_id, index)
+        if filepath.exists() and filepath.stat().st_size > 0:
+            return local_url
         
-        filename = f"image_{index}.{ext}"
-        filepath = product_dir / filename
-        
-        response = requests.get(image_url, timeout=30)
-        if response.status_code == 200:
-            with open(filepath, "wb") as f:
-                f.write(response.content)
-            return f"/public/images/products/{product_id}/{filename}"
+        tmp_path = filepath.with_name(filepath.name + ".part")
+        with _SESSION.get(image_url, stream=True, timeout=30) as response:
+            if response.status_code == 200:
+                written = 0
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > MAX_IMAGE_BYTES:
+                            break
+                        f.write(chunk)
+                if written > MAX_IMAGE_BYTES:
+                    tmp_path.unlink()
+                    print(f"Skipping image over {MAX_IMAGE_BYTES} bytes: {image_url}")
+                else:
+                    os.replace(tmp_path, filepath)
+                    return local_url
     except Exception as e:
         print(f"Error downloading image: {e}")
     
     return "/public/images/placeholder.png"
 
-def generate_ai_seo(product_name, description, category):
-    """Generate SEO content using OpenAI"""
-    api_key = os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
+def download_product_images(products, cj_products):
+    """Download the main image of each product concurrently and patch in the local paths"""
+    if not HAS_AIOHTTP:
+        return download_product_images_threaded(products, cj_products)
+    
+    jobs = []
+    targets = []
+    for product, cj_prod in zip(products, cj_products):
+        main_image = cj_prod.get("productImage", "")
+        if not main_image:
+            continue
+        try:
+            filepath, local_url = image_target(main_image, product["id"], 0)
+        except Exception as e:
+            print(f"Error preparing image download: {e}")
+            product["images"][0] = "/public/images/placeholder.png"
+            continue
+        jobs.append((main_image, filepath, local_url))
+        targets.append(product)
+    
+    if not jobs:
+        return 0
+    
+    print(f"Downloading {len(jobs)} images...")
+    local_urls = asyncio.run(download_many(jobs))
+    for product, local_url in zip(targets, local_urls):
+        product["images"][0] = local_url
+    return len(jobs)
+
+def download_product_images_threaded(products, cj_products):
+    """Thread pool fallback for download_product_images when aiohttp is not installed"""
+    jobs = []
+    targets = []
+    for product, cj_prod in zip(products, cj_products):
+        main_image = cj_prod.get("productImage", "")
+        if main_image:
+            jobs.append((main_image, product["id"], 0))
+            targets.append(product)
+    
+    if not jobs:
+        return 0
+    
+    print(f"Downloading {len(jobs)} images...")
+    with ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS) as executor:
+        local_urls = list(executor.map(lambda job: download_product_image(*job), jobs))
+    for product, local_url in zip(targets, local_urls):
+        product["images"][0] = local_url
+    return len(jobs)
+
+SEO_BATCH_SIZE = 15
+SEO_MODEL = "gpt-4o-mini"
+SEO_WORKERS = 4
+SEO_MAX_RPS = 5
+
+# AI SEO results keyed by content hash: an in-process layer over a shelve db
+_seo_memory = {}
+_seo_db = None
+_seo_db_disabled = False
+_seo_cache_lock = threading.Lock()
+_seo_rate_lock = threading.Lock()
+_seo_next_request = 0.0
+
+def seo_cache_key(product_name, description, category):
+    return hashlib.sha256(f"{product_name}|{description}|{category}|{SEO_MODEL}".encode()).hexdigest()
+
+def seo_fingerprint(product_name, description, category):
+    """Fingerprint of the fields SEO is generated from, stored as seo["_fp"]
+    
+    Only AI-generated SEO is stamped, so fallback content is retried on the next rebuild.
+    """
+    return hashlib.sha1(f"{product_name}|{description}|{category}".encode()).hexdigest()
+
+def get_openai_key():
+    return os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
+
+def is_ai_seo(product_name, description, category):
+    """True when AI SEO for these fields is in the cache (never without an API key, as only fallback SEO is used then)"""
+    if not get_openai_key():
+        return False
+    return _seo_cache_get(seo_cache_key(product_name, description, category)) is not None
+
+def _disable_seo_db(e):
+    """Stop using the shelve layer for the rest of the process after a dbm/OS error
+    
+    dbm.error is the tuple (dbm.error, OSError), which also covers the backend errors.
+    """
+    global _seo_db, _seo_db_disabled
+    print(f"SEO cache unavailable, continuing without it: {e}")
+    _seo_db_disabled = True
+    if _seo_db is not None:
+        try:
+            _seo_db.close()
+        except dbm.error:
+            pass
+        _seo_db = None
+
+def _open_seo_cache():
+    """Open the shelve db on first use; None once it has failed"""
+    global _seo_db
+    if _seo_db is None and not _seo_db_disabled:
+        try:
+            DATA_DIR.mkdir(parents=True, exist_ok=True)
+            _seo_db = shelve.open(str(SEO_CACHE_FILE))
+        except dbm.error as e:
+            _disable_seo_db(e)
+            return None
+        atexit.register(_seo_db.close)
+    return _seo_db
+
+def _seo_cache_get(key):
+    with _seo_cache_lock:
+        if key not in _seo_memory:
+            db = _open_seo_cache()
+            if db is None:
+                return None
+            try:
+                value = db.get(key)
+            except dbm.error as e:
+                _disable_seo_db(e)
+                return None
+            if value is None:
+                return None
+            _seo_memory[key] = value
+        return dict(_seo_memory[key])
+
+def _seo_cache_put(key, value):
+    with _seo_cache_lock:
+        _seo_memory[key] = value
+        db = _open_seo_cache()
+        if db is None:
+            return
+        try:
+            db[key] = value
+            db.sync()
+        except dbm.error as e:
+            _disable_seo_db(e)
+
+def fallback_seo(product_name, description, category, meta_tags=None):
+    """Basic SEO content without AI"""
+    return {
+        "seo_title": f"{product_name} | GetPawsy",
+        "seo_description": description[:160] if description else product_name,
+        "bullet_points": [description] if description else [],
+        "meta_tags": meta_tags if meta_tags is not None else ["pet", "dog", "cat", "toys", "accessories"],
+        "google_shopping_description": description[:500] if description else product_name
+    }
+
+def wait_for_seo_slot():
+    """Block until another OpenAI SEO request fits under SEO_MAX_RPS, across all threads"""
+    global _seo_next_request
+    with _seo_rate_lock:
+        now = time.monotonic()
+        start = max(now, _seo_next_request)
+        _seo_next_request = start + 1.0 / SEO_MAX_RPS
+    if start > now:
+        time.sleep(start - now)
+
+def chunked(items, size):
+    """Yield successive lists of at most size items"""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def generate_ai_seo_batch(products):
+    """Generate SEO content for several products in one OpenAI request
+    
+    products is a list of {"id", "name", "description", "category"} dicts;
+    returns a dict of SEO content keyed by product id.
+    """
+    api_key = get_openai_key()
     
     if not api_key:
         return {
-            "seo_title": f"{product_name} | GetPawsy",
-            "seo_description": description[:160] if description else product_name,
-            "bullet_points": [description] if description else [],
-            "meta_tags": category.lower().split() if category else ["pet"],
-            "google_shopping_description": description[:500] if description else product_name
+            str(p["id"]): fallback_seo(
+                p["name"], p["description"], p["category"],
+                meta_tags=p["category"].lower().split() if p["category"] else ["pet"]
+            )
+            for p in products
         }
     
+    seo_map = {}
+    missing = []
+    for p in products:
+        cached = _seo_cache_get(seo_cache_key(p["name"], p["description"], p["category"]))
+        if cached is not None:
+            seo_map[str(p["id"])] = cached
+        else:
+            missing.append(p)
+    if not missing:
+        return seo_map
+    
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        wait_for_seo_slot()
+        response = _SESSION.post(
+            OPENAI_CHAT_URL,
             headers={
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {api_key}"
             },
             json={
-                "model": "gpt-4o-mini",
+                "model": SEO_MODEL,
                 "messages": [
                     {
                         "role": "system",
@@ -113,63 +403,164 @@ def generate_ai_seo(product_name, description, category):
                     },
                     {
                         "role": "user",
-                        "content": f"""Generate SEO content for this pet product:
-Name: {product_name}
-Description: {description}
-Category: {category}
+                        "content": f"""Generate SEO content for each of these pet products:
+{json.dumps([{"id": str(p["id"]), "name": p["name"], "description": p["description"], "category": p["category"]} for p in missing])}
 
-Return JSON with: seo_title (max 60 chars), seo_description (max 160 chars), bullet_points (array of 3-5 benefits), meta_tags (array of 5-8 keywords), google_shopping_description (max 500 chars)"""
+Return a JSON object keyed by product id. Each value has: seo_title (max 60 chars), seo_description (max 160 chars), bullet_points (array of 3-5 benefits), meta_tags (array of 5-8 keywords), google_shopping_description (max 500 chars)"""
                     }
                 ],
                 "temperature": 0.7
             },
-            timeout=30
+            timeout=30 + 10 * len(missing)
         )
         
         if response.status_code == 200:
             content = response.json()["choices"][0]["message"]["content"]
             content = content.replace("```json", "").replace("```", "").strip()
-            return json.loads(content)
+            generated = {str(k): v for k, v in json.loads(content).items() if isinstance(v, dict)}
+            for p in missing:
+                seo_data = generated.get(str(p["id"]))
+                if seo_data is not None:
+                    _seo_cache_put(seo_cache_key(p["name"], p["description"], p["category"]), seo_data)
+                    seo_map[str(p["id"])] = dict(seo_data)
     except Exception as e:
         print(f"AI SEO generation error: {e}")
     
-    return {
-        "seo_title": f"{product_name} | GetPawsy",
-        "seo_description": description[:160] if description else product_name,
-        "bullet_points": [description] if description else [],
-        "meta_tags": ["pet", "dog", "cat", "toys", "accessories"],
-        "google_shopping_description": description[:500] if description else product_name
-    }
+    for p in missing:
+        pid = str(p["id"])
+        if pid not in seo_map:
+            seo_map[pid] = fallback_seo(p["name"], p["description"], p["category"])
+    return seo_map
 
-def fetch_cj_products(access_token, category_id=None, page=1, limit=50):
-    """Fetch products from CJ API"""
+def generate_ai_seo(product_name, description, category):
+    """Generate SEO content using OpenAI"""
+    product = {"id": "0", "name": product_name, "description": description, "category": category}
+    return generate_ai_seo_batch([product])["0"]
+
+def fetch_with_cj_token(access_token, fetch):
+    """Return fetch(access_token); when CJ rejects the token, drop the cached one and retry once with a fresh token
+    
+    Returns None when no accepted token can be obtained.
+    """
+    try:
+        return fetch(access_token)
+    except AuthError as e:
+        print(f"CJ rejected the access token ({e}), requesting a new one")
+    
+    access_token = get_cj_access_token(refresh=True)
     if not access_token:
-        return generate_demo_products()
+        return None
+    try:
+        return fetch(access_token)
+    except AuthError as e:
+        print(f"CJ rejected a fresh access token: {e}")
+    return None
+
+def fetch_cj_page(access_token, category_id=None, page=1, limit=50):
+    """Fetch one product-list page from CJ API, or None when the request fails
     
+    Raises AuthError when CJ rejects the access token.
+    """
     try:
-        params = {
-            "pageNum": page,
-            "pageSize": limit,
-            "countryCode": "US"
-        }
-        if category_id:
-            params["categoryId"] = category_id
+        params = cj_product_list_params(page, limit, category_id)
         
-        response = requests.get(
+        response = _SESSION.get(
             f"{CJ_API_BASE}/product/list",
             headers={"CJ-Access-Token": access_token},
             params=params,
             timeout=30
         )
         
+        if response.status_code == 401:
+            raise AuthError("CJ answered 401")
         if response.status_code == 200:
             data = response.json()
+            if is_cj_auth_error(data):
+                raise AuthError(data.get("message") or "CJ rejected the access token")
             if data.get("result") and data.get("data"):
                 return data["data"].get("list", [])
+    except AuthError:
+        raise
     except Exception as e:
         print(f"Error fetching CJ products: {e}")
     
-    return generate_demo_products()
+    return None
+
+def fetch_cj_products(access_token, category_id=None, page=1, limit=50):
+    """Fetch products from CJ API"""
+    if not access_token:
+        return generate_demo_products()
+    
+    products = fetch_with_cj_token(access_token, lambda token: fetch_cj_page(token, category_id, page, limit))
+    return products if products is not None else generate_demo_products()
+
+def cj_product_list_params(page, limit, category_id=None):
+    params = {
+        "pageNum": page,
+        "pageSize": limit,
+        "countryCode": "US"
+    }
+    if category_id:
+        params["categoryId"] = category_id
+    return params
+
+async def fetch_cj_products_async(access_token, pages=range(1, 21), limit=CJ_PAGE_SIZE, category_id=None):
+    """Fetch several CJ product-list pages concurrently and return the flattened list
+    
+    Returns None when every page request failed.
+    """
+    payloads = await fetch_json_many(
+        f"{CJ_API_BASE}/product/list",
+        {"CJ-Access-Token": access_token},
+        [cj_product_list_params(page, limit, category_id) for page in pages],
+        max_concurrency=CJ_PAGE_CONCURRENCY
+    )
+    
+    products = []
+    answered = False
+    for data in payloads:
+        if is_cj_auth_error(data):
+            raise AuthError(data.get("message") or "CJ rejected the access token")
+        if data and data.get("result"):
+            answered = True
+            if data.get("data"):
+                products.extend(data["data"].get("list", []))
+    return products if answered else None
+
+def fetch_cj_pages(access_token, pages, page_size, category_id=None):
+    """Fetch the given CJ product-list pages, concurrently when aiohttp is available
+    
+    Returns None when every page request failed, so callers can tell an
+    unreachable API from an empty result. Raises AuthError when CJ rejects the
+    access token.
+    """
+    if HAS_AIOHTTP:
+        return asyncio.run(fetch_cj_products_async(access_token, pages, page_size, category_id))
+    
+    products = None
+    for page in pages:
+        page_products = fetch_cj_page(access_token, category_id, page, page_size)
+        if page_products is None:
+            break
+        if products is None:
+            products = []
+        if not page_products:
+            break
+        products.extend(page_products)
+    return products
+
+def fetch_cj_products_paged(access_token, total, category_id=None):
+    """Fetch up to total products, requesting the pages concurrently when aiohttp is available"""
+    if not access_token:
+        return generate_demo_products()
+    if total <= 0:
+        return []
+    
+    page_size = min(total, CJ_PAGE_SIZE)
+    pages = range(1, -(-total // page_size) + 1)
+    
+    products = fetch_with_cj_token(access_token, lambda token: fetch_cj_pages(token, pages, page_size, category_id))
+    return products[:total] if products is not None else generate_demo_products()
 
 def generate_demo_products():
     """Generate demo products when CJ API is unavailable"""
@@ -184,11 +575,12 @@ def generate_demo_products():
     
     for cat_name, products in categories:
         for i, prod_name in enumerate(products):
-            cost = 5 + (i * 3) + (hash(prod_name) % 10)
+            h = zlib.crc32(prod_name.encode())
+            cost = 5 + (i * 3) + (h % 10)
             demo_products.append({
                 "pid": f"cj-{cat_name.lower().replace(' ', '-')}-{i+1}",
                 "productNameEn": prod_name,
-                "productSku": f"SKU-{hash(prod_name) % 10000:04d}",
+                "productSku": f"SKU-{h % 10000:04d}",
                 "sellPrice": cost,
                 "productImage": "",
                 "categoryName": cat_name,
@@ -218,14 +610,18 @@ def transform_cj_product(cj_product, download_images=True):
     else:
         images.append("/public/images/placeholder.png")
     
+    # crc32 rather than hash(): str hashing is randomized per process
+    name_hash = zlib.crc32(name.encode())
+    
     sell_price = calculate_markup_price(cost_price)
     old_price = round(sell_price * 1.25, 2)
     old_price = int(old_price) + 0.99
     
     seo_data = generate_ai_seo(name, description, category)
     
-    pet_type = "dog" if "dog" in category.lower() else "cat" if "cat" in category.lower() else "pet"
-    tags = [pet_type, category.lower().replace(" ", "-")]
+    category_lower = category.lower()
+    pet_type = "dog" if "dog" in category_lower else "cat" if "cat" in category_lower else "pet"
+    tags = [pet_type, category_lower.replace(" ", "-")]
     tags.extend(seo_data.get("meta_tags", [])[:5])
     
     product = {
@@ -239,9 +635,9 @@ def transform_cj_product(cj_product, download_images=True):
         "cost": cost_price,
         "old_price": old_price,
         "images": images,
-        "rating": round(4.0 + (hash(name) % 10) / 10, 1),
-        "reviews_count": 10 + (hash(name) % 200),
-        "stock": 50 + (hash(name) % 150),
+        "rating": round(4.0 + (name_hash % 10) / 10, 1),
+        "reviews_count": 10 + (name_hash % 200),
+        "stock": 50 + (name_hash % 150),
         "category": category,
         "tags": list(set(tags)),
         "weight": cj_product.get("productWeight", 0.5),
@@ -251,6 +647,8 @@ def transform_cj_product(cj_product, download_images=True):
         "imported_at": datetime.now().isoformat(),
         "published": True
     }
+    if is_ai_seo(name, description, category):
+        seo_data["_fp"] = seo_fingerprint(name, product["description"], category)
     
     return product
 
@@ -258,13 +656,34 @@ def load_existing_products():
     """Load existing products from JSON"""
     if PRODUCTS_FILE.exists():
         try:
-            with open(PRODUCTS_FILE, "r") as f:
-                data = json.load(f)
+            with open(PRODUCTS_FILE, "rb") as f:
+                data = json_loads(f.read())
                 return data.get("products", [])
         except:
             pass
     return []
 
+def load_existing_bundles():
+    """Load existing bundles, falling back to the legacy section of products_v5.json"""
+    for source in (BUNDLES_FILE, PRODUCTS_FILE):
+        if source.exists():
+            try:
+                with open(source, "rb") as f:
+                    data = json_loads(f.read())
+                if "bundles" in data:
+                    return data["bundles"]
+            except:
+                pass
+    return []
+
+def save_bundles(bundles):
+    """Write bundles_v5.json, skipping the write when the bundles are unchanged"""
+    content = json_dumps({"bundles": bundles, "bundle_count": len(bundles)}, indent=True)
+    if BUNDLES_FILE.exists() and BUNDLES_FILE.read_bytes() == content:
+        return False
+    write_file_atomic(BUNDLES_FILE, content)
+    return True
+
 def save_products(products):
     """Save products to JSON file"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -277,16 +696,18 @@ def save_products(products):
         else:
             regular_products.append(p)
     
+    if not bundles:
+        bundles = load_existing_bundles()
+    save_bundles(bundles)
+    
     data = {
         "products": regular_products,
-        "bundles": bundles,
         "updated_at": datetime.now().isoformat(),
         "total_count": len(regular_products),
         "bundle_count": len(bundles)
     }
     
-    with open(PRODUCTS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    write_file_atomic(PRODUCTS_FILE, json_dumps(data, indent=True))
     
     print(f"Saved {len(regular_products)} products and {len(bundles)} bundles")
 
@@ -306,19 +727,25 @@ def import_all(download_images=True, limit=100):
     existing_ids = {p.get("id") for p in existing_products}
     print(f"Existing products: {len(existing_products)}")
     
-    cj_products = fetch_cj_products(access_token, limit=limit)
+    cj_products = fetch_cj_products_paged(access_token, limit)
     print(f"Fetched {len(cj_products)} products from CJ")
     
-    new_count = 0
+    new_products = []
+    new_cj_products = []
     for cj_prod in cj_products:
         pid = cj_prod.get("pid", "")
         if pid and pid not in existing_ids:
-            product = transform_cj_product(cj_prod, download_images)
-            existing_products.append(product)
+            product = transform_cj_product(cj_prod, download_images=False)
+            new_products.append(product)
+            new_cj_products.append(cj_prod)
             existing_ids.add(pid)
-            new_count += 1
             print(f"  + {product['name'][:40]}... ${product['price']}")
     
+    if download_images:
+        download_product_images(new_products, new_cj_products)
+    
+    new_count = len(new_products)
+    existing_products.extend(new_products)
     save_products(existing_products)
     
     print("=" * 50)
@@ -346,30 +773,54 @@ def sync_prices():
                 product["old_price"] = round(new_price * 1.25, 2)
                 updated += 1
     
-    save_products(products)
+    if updated:
+        save_products(products)
     print(f"Updated {updated} product prices")
     return {"updated": updated}
 
 def rebuild_seo():
-    """Rebuild SEO for all products"""
+    """Rebuild SEO for products whose name, description or category changed"""
     print("Rebuilding SEO for all products...")
     
     products = load_existing_products()
     
-    for i, product in enumerate(products):
-        print(f"  Processing {i+1}/{len(products)}: {product['name'][:30]}...")
-        seo_data = generate_ai_seo(
-            product.get("name", ""),
-            product.get("description", ""),
-            product.get("category", "")
-        )
-        product["seo"] = seo_data
-        product["title"] = seo_data.get("seo_title", product["name"])
-        time.sleep(0.5)
+    stale = []
+    for product in products:
+        fp = seo_fingerprint(product.get("name", ""), product.get("description", ""), product.get("category", ""))
+        if product.get("seo", {}).get("_fp") != fp:
+            stale.append((product, fp))
+    
+    chunks = list(chunked(stale, SEO_BATCH_SIZE))
+    batches = [
+        [
+            {
+                "id": str(i),
+                "name": product.get("name", ""),
+                "description": product.get("description", ""),
+                "category": product.get("category", "")
+            }
+            for i, (product, _) in enumerate(chunk)
+        ]
+        for chunk in chunks
+    ]
     
-    save_products(products)
-    print(f"SEO rebuilt for {len(products)} products")
-    return {"count": len(products)}
+    done = 0
+    with ThreadPoolExecutor(max_workers=SEO_WORKERS) as executor:
+        for chunk, seo_map in zip(chunks, executor.map(generate_ai_seo_batch, batches)):
+            print(f"  Processed {done+1}-{done+len(chunk)}/{len(stale)}")
+            for i, (product, fp) in enumerate(chunk):
+                seo_data = seo_map[str(i)]
+                if is_ai_seo(product.get("name", ""), product.get("description", ""), product.get("category", "")):
+                    seo_data["_fp"] = fp
+                product["seo"] = seo_data
+                product["title"] = seo_data.get("seo_title", product["name"])
+            done += len(chunk)
+    
+    if stale:
+        save_products(products)
+    skipped = len(products) - len(stale)
+    print(f"SEO rebuilt for {len(stale)} products ({skipped} unchanged, skipped)")
+    return {"count": len(products), "regenerated": len(stale), "skipped": skipped}
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+GetPawsy CJ Importer V5 - Concurrent HTTP helpers
+Downloads product images and API pages in parallel instead of one request at a time
+"""
+
+import os
+import asyncio
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    aiohttp = None
+    HAS_AIOHTTP = False
+
+PLACEHOLDER_IMAGE = "/public/images/placeholder.png"
+MAX_CONNECTIONS = 16
+DOWNLOAD_TIMEOUT = 30
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+class AuthError(Exception):
+    """The server rejected the request's credentials (HTTP 401)"""
+
+async def download_image(session, image_url, filepath, local_url):
+    """Stream one image to filepath, returning its public URL or the placeholder
+    
+    Chunks go straight to a .part file, so memory use stays at one chunk per download.
+    """
+    if filepath.exists() and filepath.stat().st_size > 0:
+        return local_url
+
+    tmp_path = filepath.with_name(filepath.name + ".part")
+    try:
+        async with session.get(image_url) as response:
+            if response.status == 200:
+                written = 0
+                f = await asyncio.to_thread(open, tmp_path, "wb")
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > MAX_IMAGE_BYTES:
+                            break
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+                if written > MAX_IMAGE_BYTES:
+                    await asyncio.to_thread(tmp_path.unlink)
+                    print(f"Skipping image over {MAX_IMAGE_BYTES} bytes: {image_url}")
+                    return PLACEHOLDER_IMAGE
+                await asyncio.to_thread(os.replace, tmp_path, filepath)
+                return local_url
+    except Exception as e:
+        print(f"Error downloading image: {e}")
+        tmp_path.unlink(missing_ok=True)
+
+    return PLACEHOLDER_IMAGE
+
+async def download_many(jobs):
+    """Download (image_url, filepath, local_url) jobs concurrently, results in job order"""
+    if not jobs:
+        return []
+
+    # Queue at the semaphore, not the connection pool, so the timeout only covers the download itself
+    semaphore = asyncio.Semaphore(MAX_CONNECTIONS)
+
+    async def download_limited(session, image_url, filepath, local_url):
+        async with semaphore:
+            return await download_image(session, image_url, filepath, local_url)
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(download_limited(session, image_url, filepath, local_url))
+                for image_url, filepath, local_url in jobs
+            ]
+
+    return [task.result() for task in tasks]
+
+async def fetch_json_many(url, headers, params_list, max_concurrency=8):
+    """GET url once per params dict concurrently, returning parsed JSON (or None) in order
+    
+    Raises AuthError when any request is answered 401.
+    """
+    if not params_list:
+        return []
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_json(session, params):
+        async with semaphore:
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status == 200:
+                        return await response.json(content_type=None)
+                    if response.status == 401:
+                        raise AuthError(f"{url} answered 401")
+            except AuthError:
+                raise
+            except Exception as e:
+                print(f"Error fetching {url}: {e}")
+            return None
+
+    # A TaskGroup cancels the remaining requests once one of them raises AuthError
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(fetch_json(session, params)) for params in params_list]
+        except* AuthError as eg:
+            raise eg.exceptions[0] from None
+
+    return [task.result() for task in tasks]
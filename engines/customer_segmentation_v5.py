@@ -6,26 +6,53 @@ AI-powered customer segmentation for targeted marketing
 
 import os
 import json
-import requests
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from collections import defaultdict
 
+try:
+    from .json_io import json_loads, json_dumps, json_dumps_line
+except ImportError:
+    from json_io import json_loads, json_dumps, json_dumps_line
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 SEGMENTS_FILE = DATA_DIR / "customer_segments.json"
+CUSTOMER_DATA_FILE = DATA_DIR / "customer_data.jsonl"
 USERS_FILE = DATA_DIR / "users.json"
 ORDERS_FILE = DATA_DIR / "orders.json"
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Shared session so repeated insight requests reuse the OpenAI connection.
+# Created on first use: only AI insights need requests, so segmentation runs skip importing it.
+_SESSION = None
+
+def get_session():
+    """Return the shared OpenAI session, importing requests on first call"""
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _SESSION = requests.Session()
+        _SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+    return _SESSION
 
 def get_openai_key():
     return os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
 
+# Parsed segments file, reused until its mtime changes
+_segments_cache = {"mtime": None, "data": None}
+
 def load_segments() -> Dict:
     """Load customer segments"""
     if SEGMENTS_FILE.exists():
-        with open(SEGMENTS_FILE, "r") as f:
-            return json.load(f)
+        mtime = SEGMENTS_FILE.stat().st_mtime_ns
+        if _segments_cache["mtime"] != mtime:
+            with open(SEGMENTS_FILE, "rb") as f:
+                _segments_cache["data"] = json_loads(f.read())
+            _segments_cache["mtime"] = mtime
+        return _segments_cache["data"]
     
     # Default segments
     default_segments = {
@@ -87,7 +114,8 @@ def load_segments() -> Dict:
                 "icon": "💰"
             }
         },
-        "customer_data": {},
+        "customer_count": 0,
+        "segment_counts": {},
         "last_analysis": None
     }
     save_segments(default_segments)
@@ -96,8 +124,21 @@ def load_segments() -> Dict:
 def save_segments(data: Dict):
     """Save segments"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(SEGMENTS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    with open(SEGMENTS_FILE, "wb") as f:
+        f.write(json_dumps(data, indent=True))
+    _segments_cache["data"] = data
+    _segments_cache["mtime"] = SEGMENTS_FILE.stat().st_mtime_ns
+
+def iter_customers():
+    """Yield analyzed customer records one at a time from customer_data.jsonl"""
+    if CUSTOMER_DATA_FILE.exists():
+        with open(CUSTOMER_DATA_FILE, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json_loads(line)
+        return
+    # Segments files written before customer_data.jsonl kept customers inline
+    yield from load_segments().get("customer_data", {}).values()
 
 def load_users() -> List[Dict]:
     """Load users"""
@@ -123,9 +164,55 @@ def load_orders() -> List[Dict]:
                 return data.get("orders", [])
     return []
 
-def analyze_customer(user_id: str, email: str, orders: List[Dict]) -> Dict:
+# Item category -> "dog" / "cat" / None, memoized since the same categories repeat across orders
+_PET_OF = {}
+
+def category_pet(category: str) -> Optional[str]:
+    """Classify an item category as a dog or cat category"""
+    pet = _PET_OF.get(category, False)
+    if pet is False:
+        cat = category.lower()
+        pet = "dog" if "dog" in cat else "cat" if "cat" in cat else None
+        _PET_OF[category] = pet
+    return pet
+
+def parse_order_date(order: Dict) -> Optional[datetime]:
+    """Parse an order's created_at/date as a naive local datetime"""
+    try:
+        if order.get("created_at"):
+            parsed = datetime.fromisoformat(order["created_at"].replace("Z", "+00:00"))
+        elif order.get("date"):
+            parsed = datetime.fromisoformat(order["date"])
+        else:
+            return None
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def index_orders(orders: List[Dict]) -> Dict:
+    """Group order positions by user_id and by email, and parse order dates, in a single pass"""
+    by_user_id = defaultdict(list)
+    by_email = defaultdict(list)
+    dates = []
+    for i, o in enumerate(orders):
+        by_user_id[o.get("user_id")].append(i)
+        by_email[o.get("email")].append(i)
+        dates.append(parse_order_date(o))
+    return {"by_user_id": by_user_id, "by_email": by_email, "dates": dates}
+
+def analyze_customer(user_id: str, email: str, orders: List[Dict], order_index: Optional[Dict] = None) -> Dict:
     """Analyze a single customer's behavior"""
-    user_orders = [o for o in orders if o.get("user_id") == user_id or o.get("email") == email]
+    if order_index is None:
+        user_orders = [o for o in orders if o.get("user_id") == user_id or o.get("email") == email]
+        order_dates = [parse_order_date(o) for o in user_orders]
+    else:
+        positions = set(order_index["by_user_id"].get(user_id, ()))
+        positions.update(order_index["by_email"].get(email, ()))
+        positions = sorted(positions)
+        user_orders = [orders[i] for i in positions]
+        order_dates = [order_index["dates"][i] for i in positions]
     
     if not user_orders:
         return {
@@ -140,33 +227,28 @@ def analyze_customer(user_id: str, email: str, orders: List[Dict]) -> Dict:
     total_spent = sum(o.get("total", 0) for o in user_orders)
     avg_order_value = total_spent / total_orders if total_orders > 0 else 0
     
-    # Get dates
-    order_dates = []
-    for o in user_orders:
-        try:
-            if o.get("created_at"):
-                order_dates.append(datetime.fromisoformat(o["created_at"].replace("Z", "+00:00")))
-            elif o.get("date"):
-                order_dates.append(datetime.fromisoformat(o["date"]))
-        except:
-            pass
+    # First and last order dates in one pass
+    first_order_date = None
+    last_order_date = None
+    for order_date in order_dates:
+        if order_date is None:
+            continue
+        if first_order_date is None or order_date < first_order_date:
+            first_order_date = order_date
+        if last_order_date is None or order_date > last_order_date:
+            last_order_date = order_date
     
     days_since_order = None
-    first_order_date = None
-    if order_dates:
-        order_dates.sort()
-        first_order_date = order_dates[0]
-        days_since_order = (datetime.now() - order_dates[-1]).days
+    if last_order_date is not None:
+        days_since_order = (datetime.now() - last_order_date).days
     
     # Analyze categories
     category_counts = defaultdict(int)
     for o in user_orders:
         for item in o.get("items", []):
-            cat = item.get("category", "").lower()
-            if "dog" in cat:
-                category_counts["dog"] += 1
-            elif "cat" in cat:
-                category_counts["cat"] += 1
+            pet = category_pet(item.get("category", ""))
+            if pet:
+                category_counts[pet] += 1
     
     category_preference = None
     if category_counts:
@@ -194,8 +276,8 @@ def assign_segments(customer: Dict) -> List[str]:
     """Assign segments based on customer metrics"""
     segments = []
     metrics = customer.get("metrics", {})
-    data = load_segments()
-    segment_defs = data.get("segments", {})
+    # TODO: thresholds below are hardcoded; if segment criteria become dynamic, pass
+    # segment_defs in from the data run_segmentation already loaded instead of reloading here.
     
     total_orders = metrics.get("total_orders", 0)
     total_spent = metrics.get("total_spent", 0)
@@ -235,63 +317,90 @@ def assign_segments(customer: Dict) -> List[str]:
     return segments if segments else ["potential"]
 
 def run_segmentation() -> Dict:
-    """Run full customer segmentation analysis"""
+    """Run full customer segmentation analysis
+    
+    Customer records are streamed to customer_data.jsonl as they are analyzed;
+    the segments file only keeps per-segment counts.
+    """
     users = load_users()
     orders = load_orders()
+    order_index = index_orders(orders)
     data = load_segments()
     
     results = {
         "analyzed": 0,
-        "segment_counts": defaultdict(int),
-        "customers": []
+        "segment_counts": defaultdict(int)
     }
     
-    for user in users:
-        user_id = str(user.get("id", ""))
-        email = user.get("email", "")
-        
-        if not email:
-            continue
-        
-        # Analyze customer
-        customer = analyze_customer(user_id, email, orders)
-        
-        # Assign segments
-        customer["segments"] = assign_segments(customer)
-        
-        # Store in data
-        data["customer_data"][user_id] = customer
-        
-        # Count segments
-        for seg in customer["segments"]:
-            results["segment_counts"][seg] += 1
-        
-        results["customers"].append({
-            "user_id": user_id,
-            "email": email,
-            "segments": customer["segments"],
-            "total_spent": customer["metrics"].get("total_spent", 0)
-        })
-        
-        results["analyzed"] += 1
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = CUSTOMER_DATA_FILE.with_name(CUSTOMER_DATA_FILE.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for user in users:
+            user_id = str(user.get("id", ""))
+            email = user.get("email", "")
+            
+            if not email:
+                continue
+            
+            # Analyze customer
+            customer = analyze_customer(user_id, email, orders, order_index)
+            
+            # Assign segments
+            customer["segments"] = assign_segments(customer)
+            
+            # Stream the record out instead of keeping it in memory
+            f.write(json_dumps_line(customer))
+            
+            # Count segments
+            for seg in customer["segments"]:
+                results["segment_counts"][seg] += 1
+            
+            results["analyzed"] += 1
+    os.replace(tmp_path, CUSTOMER_DATA_FILE)
     
+    results["segment_counts"] = dict(results["segment_counts"])
+    
+    data.pop("customer_data", None)
+    data["customer_count"] = results["analyzed"]
+    data["segment_counts"] = results["segment_counts"]
     data["last_analysis"] = datetime.now().isoformat()
     save_segments(data)
     
-    results["segment_counts"] = dict(results["segment_counts"])
     return results
 
+# Customers grouped by segment, rebuilt when customer_data.jsonl or the segments file changes
+_buckets_cache = {"mtime": None, "buckets": None}
+
+def get_segment_buckets() -> Dict[str, List[Dict]]:
+    """Group customers by segment id in a single pass over the customer records"""
+    load_segments()
+    customers_mtime = CUSTOMER_DATA_FILE.stat().st_mtime_ns if CUSTOMER_DATA_FILE.exists() else None
+    mtime = (customers_mtime, _segments_cache["mtime"])
+    if _buckets_cache["mtime"] != mtime:
+        buckets = defaultdict(list)
+        for customer in iter_customers():
+            for seg in customer.get("segments", []):
+                buckets[seg].append(customer)
+        _buckets_cache.update(mtime=mtime, buckets=buckets)
+    return _buckets_cache["buckets"]
+
 def get_segment_customers(segment_id: str) -> List[Dict]:
     """Get all customers in a segment"""
-    data = load_segments()
-    customers = []
-    
-    for user_id, customer in data.get("customer_data", {}).items():
-        if segment_id in customer.get("segments", []):
-            customers.append(customer)
-    
+    customers = get_segment_buckets().get(segment_id, [])
     return sorted(customers, key=lambda x: x.get("metrics", {}).get("total_spent", 0), reverse=True)
 
+def segment_totals(customers: List[Dict]) -> tuple:
+    """Customer count, revenue and order total for a segment in one pass"""
+    count = 0
+    revenue = 0.0
+    orders = 0
+    for c in customers:
+        metrics = c.get("metrics", {})
+        revenue += metrics.get("total_spent", 0)
+        orders += metrics.get("total_orders", 0)
+        count += 1
+    return count, revenue, orders
+
 def get_ai_segment_insights(segment_id: str) -> str:
     """Get AI-generated insights for a segment"""
     api_key = get_openai_key()
@@ -306,9 +415,8 @@ def get_ai_segment_insights(segment_id: str) -> str:
         return "No data available for this segment."
     
     # Prepare summary
-    total_customers = len(customers)
-    total_revenue = sum(c.get("metrics", {}).get("total_spent", 0) for c in customers)
-    avg_orders = sum(c.get("metrics", {}).get("total_orders", 0) for c in customers) / max(total_customers, 1)
+    total_customers, total_revenue, total_orders = segment_totals(customers)
+    avg_orders = total_orders / max(total_customers, 1)
     
     context = f"""
     Segment: {segment['name']}
@@ -319,8 +427,8 @@ def get_ai_segment_insights(segment_id: str) -> str:
     """
     
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        response = get_session().post(
+            OPENAI_CHAT_URL,
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
@@ -381,12 +489,12 @@ def get_segment_summary() -> Dict:
     """Get summary of all segments"""
     data = load_segments()
     segments = data.get("segments", {})
-    customer_data = data.get("customer_data", {})
+    
+    buckets = get_segment_buckets()
     
     summary = []
     for seg_id, seg in segments.items():
-        customers = [c for c in customer_data.values() if seg_id in c.get("segments", [])]
-        total_revenue = sum(c.get("metrics", {}).get("total_spent", 0) for c in customers)
+        customer_count, total_revenue, _ = segment_totals(buckets.get(seg_id, []))
         
         summary.append({
             "id": seg_id,
@@ -394,14 +502,14 @@ def get_segment_summary() -> Dict:
             "description": seg["description"],
             "icon": seg.get("icon", "📊"),
             "color": seg.get("color", "#6366f1"),
-            "customer_count": len(customers),
+            "customer_count": customer_count,
             "total_revenue": round(total_revenue, 2)
         })
     
     return {
         "segments": sorted(summary, key=lambda x: x["customer_count"], reverse=True),
         "last_analysis": data.get("last_analysis"),
-        "total_customers": len(customer_data)
+        "total_customers": data.get("customer_count", len(data.get("customer_data", {})))
     }
 
 if __name__ == "__main__":
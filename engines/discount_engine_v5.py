@@ -6,16 +6,36 @@ Coupon codes, flash sales, and bulk discounts
 
 import os
 import json
-import random
+import secrets
 import string
+import time
+import heapq
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+try:
+    from .json_io import json_dumps, json_dumps_line, write_file_atomic
+except ImportError:
+    from json_io import json_dumps, json_dumps_line, write_file_atomic
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 DISCOUNTS_FILE = DATA_DIR / "discounts.json"
-USAGE_LOG_FILE = DATA_DIR / "discount_usage.json"
+USAGE_LOG_FILE = DATA_DIR / "discount_usage.ndjson"
+LEGACY_USAGE_LOG_FILE = DATA_DIR / "discount_usage.json"
+
+# ISO timestamp string -> epoch seconds; coupon and sale dates repeat on every check
+_TS_OF = {}
+
+def iso_timestamp(value: str) -> float:
+    """Epoch seconds for an ISO datetime string, parsed once per distinct value"""
+    ts = _TS_OF.get(value)
+    if ts is None:
+        ts = _TS_OF[value] = datetime.fromisoformat(value).timestamp()
+    return ts
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
 
 # Discount types
 DISCOUNT_TYPES = {
@@ -26,11 +46,18 @@ DISCOUNT_TYPES = {
     "bundle": "Bundle discount"
 }
 
+# Parsed discounts file, reused until its mtime changes
+_discounts_cache = {"mtime": None, "data": None}
+
 def load_discounts() -> Dict:
     """Load all discounts"""
     if DISCOUNTS_FILE.exists():
-        with open(DISCOUNTS_FILE, "r") as f:
-            return json.load(f)
+        mtime = DISCOUNTS_FILE.stat().st_mtime_ns
+        if _discounts_cache["mtime"] != mtime:
+            with open(DISCOUNTS_FILE, "rb") as f:
+                _discounts_cache["data"] = json.load(f)
+            _discounts_cache["mtime"] = mtime
+        return _discounts_cache["data"]
     
     # Initialize with some default codes
     default_data = {
@@ -78,25 +105,55 @@ def load_discounts() -> Dict:
 def save_discounts(data: Dict):
     """Save discounts"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(DISCOUNTS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    write_file_atomic(DISCOUNTS_FILE, json_dumps(data))
+    _discounts_cache["data"] = data
+    _discounts_cache["mtime"] = DISCOUNTS_FILE.stat().st_mtime_ns
+
+def iter_usage_log():
+    """Yield discount usage entries one at a time, oldest first"""
+    # Entries logged before the switch to NDJSON live in the old JSON list
+    if LEGACY_USAGE_LOG_FILE.exists():
+        with open(LEGACY_USAGE_LOG_FILE, "rb") as f:
+            yield from json.load(f)
+    if USAGE_LOG_FILE.exists():
+        with open(USAGE_LOG_FILE, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
 
 def load_usage_log() -> List[Dict]:
     """Load discount usage log"""
-    if USAGE_LOG_FILE.exists():
-        with open(USAGE_LOG_FILE, "r") as f:
-            return json.load(f)
-    return []
+    return list(iter_usage_log())
 
 def save_usage_log(log: List[Dict]):
-    """Save usage log"""
-    with open(USAGE_LOG_FILE, "w") as f:
-        json.dump(log, f, indent=2)
+    """Save usage log, replacing any existing entries"""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    write_file_atomic(USAGE_LOG_FILE, b"".join(json_dumps_line(entry) for entry in log))
+    if LEGACY_USAGE_LOG_FILE.exists():
+        LEGACY_USAGE_LOG_FILE.unlink()
+
+def append_usage(entry: Dict):
+    """Append one entry to the usage log without rewriting it"""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    with open(USAGE_LOG_FILE, "ab") as f:
+        f.write(json_dumps_line(entry))
+
+# Coupons keyed by code, rebuilt whenever a different discounts dict is loaded
+_coupon_index = {"data": None, "index": None}
+
+def get_coupon_index(data: Dict) -> Dict[str, Dict]:
+    """Map coupon code -> coupon dict for the given discounts data"""
+    if _coupon_index["data"] is not data:
+        index = {}
+        for c in data.get("coupons", []):
+            index.setdefault(c["code"], c)
+        _coupon_index["index"] = index
+        _coupon_index["data"] = data
+    return _coupon_index["index"]
 
 def generate_code(prefix: str = "PAWSY", length: int = 6) -> str:
     """Generate a unique coupon code"""
-    chars = string.ascii_uppercase + string.digits
-    suffix = ''.join(random.choices(chars, k=length))
+    suffix = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(length))
     return f"{prefix}{suffix}"
 
 def create_coupon(
@@ -120,7 +177,8 @@ def create_coupon(
     code = code.upper()
     
     # Check if code exists
-    if any(c["code"] == code for c in data["coupons"]):
+    index = get_coupon_index(data)
+    if code in index:
         return {"success": False, "error": "Code already exists"}
     
     expires_at = None
@@ -144,6 +202,7 @@ def create_coupon(
     }
     
     data["coupons"].append(coupon)
+    index[code] = coupon
     save_discounts(data)
     
     return {"success": True, "coupon": coupon}
@@ -154,7 +213,7 @@ def validate_coupon(code: str, order_total: float, user_id: str = None,
     data = load_discounts()
     code = code.upper()
     
-    coupon = next((c for c in data["coupons"] if c["code"] == code), None)
+    coupon = get_coupon_index(data).get(code)
     
     if not coupon:
         return {"valid": False, "error": "Invalid coupon code"}
@@ -164,8 +223,7 @@ def validate_coupon(code: str, order_total: float, user_id: str = None,
     
     # Check expiration
     if coupon.get("expires_at"):
-        expires = datetime.fromisoformat(coupon["expires_at"])
-        if datetime.now() > expires:
+        if time.time() > iso_timestamp(coupon["expires_at"]):
             return {"valid": False, "error": "This coupon has expired"}
     
     # Check max uses
@@ -181,7 +239,8 @@ def validate_coupon(code: str, order_total: float, user_id: str = None,
         return {"valid": False, "error": "This coupon is for first orders only"}
     
     # Calculate discount
-    discount = calculate_discount(coupon, order_total, cart_items)
+    max_percent = data.get("settings", {}).get("max_discount_percent", 50)
+    discount = calculate_discount(coupon, order_total, cart_items, max_percent)
     
     return {
         "valid": True,
@@ -190,8 +249,12 @@ def validate_coupon(code: str, order_total: float, user_id: str = None,
         "new_total": max(0, order_total - discount)
     }
 
-def calculate_discount(coupon: Dict, order_total: float, cart_items: List[Dict] = None) -> float:
-    """Calculate discount amount"""
+def calculate_discount(coupon: Dict, order_total: float, cart_items: List[Dict] = None,
+                       max_percent: float = None) -> float:
+    """Calculate discount amount
+    
+    max_percent caps the discount; when omitted it is read from the discount settings.
+    """
     discount_type = coupon.get("type", "percentage")
     value = coupon.get("value", 0)
     
@@ -205,8 +268,8 @@ def calculate_discount(coupon: Dict, order_total: float, cart_items: List[Dict]
         discount = 0
     
     # Apply max discount cap
-    data = load_discounts()
-    max_percent = data.get("settings", {}).get("max_discount_percent", 50)
+    if max_percent is None:
+        max_percent = load_discounts().get("settings", {}).get("max_discount_percent", 50)
     max_discount = order_total * (max_percent / 100)
     
     return min(discount, max_discount)
@@ -216,23 +279,20 @@ def apply_coupon(code: str, order_id: str, user_id: str, discount_amount: float)
     data = load_discounts()
     code = code.upper()
     
-    for coupon in data["coupons"]:
-        if coupon["code"] == code:
-            coupon["uses"] = coupon.get("uses", 0) + 1
-            break
+    coupon = get_coupon_index(data).get(code)
+    if coupon:
+        coupon["uses"] = coupon.get("uses", 0) + 1
     
     save_discounts(data)
     
     # Log usage
-    log = load_usage_log()
-    log.append({
+    append_usage({
         "code": code,
         "order_id": order_id,
         "user_id": user_id,
         "discount_amount": discount_amount,
         "applied_at": datetime.now().isoformat()
     })
-    save_usage_log(log)
     
     return {"success": True}
 
@@ -266,36 +326,43 @@ def create_flash_sale(
 def get_active_flash_sales() -> List[Dict]:
     """Get currently active flash sales"""
     data = load_discounts()
-    now = datetime.now()
+    now = time.time()
     
     active = []
     for sale in data.get("flash_sales", []):
         if not sale.get("active"):
             continue
         
-        starts = datetime.fromisoformat(sale["starts_at"])
-        ends = datetime.fromisoformat(sale["ends_at"])
+        starts = iso_timestamp(sale["starts_at"])
+        ends = iso_timestamp(sale["ends_at"])
         
         if starts <= now <= ends:
-            # Calculate time remaining
-            remaining = ends - now
-            sale["hours_remaining"] = remaining.total_seconds() / 3600
-            active.append(sale)
+            # Calculate time remaining on a copy so the cached sale stays as stored
+            active.append({**sale, "hours_remaining": (ends - now) / 3600})
     
     return active
 
+# Bulk rules sorted by min_qty descending, re-sorted only when the discounts file changes
+_bulk_rules_cache = {"rules": None, "mtime": None, "sorted": []}
+
+def get_sorted_bulk_rules(data: Dict) -> List[Dict]:
+    """Bulk rules ordered from the highest min_qty down"""
+    rules = data.get("bulk_rules", [])
+    if _bulk_rules_cache["rules"] is not rules or _bulk_rules_cache["mtime"] != _discounts_cache["mtime"]:
+        _bulk_rules_cache.update(
+            rules=rules,
+            mtime=_discounts_cache["mtime"],
+            sorted=sorted(rules, key=lambda x: x["min_qty"], reverse=True)
+        )
+    return _bulk_rules_cache["sorted"]
+
 def get_bulk_discount(quantity: int) -> Optional[Dict]:
     """Get applicable bulk discount"""
-    data = load_discounts()
-    rules = data.get("bulk_rules", [])
-    
-    applicable = None
-    for rule in sorted(rules, key=lambda x: x["min_qty"], reverse=True):
+    for rule in get_sorted_bulk_rules(load_discounts()):
         if quantity >= rule["min_qty"]:
-            applicable = rule
-            break
+            return rule
     
-    return applicable
+    return None
 
 def get_all_coupons() -> List[Dict]:
     """Get all coupons"""
@@ -307,28 +374,34 @@ def deactivate_coupon(code: str) -> Dict:
     data = load_discounts()
     code = code.upper()
     
-    for coupon in data["coupons"]:
-        if coupon["code"] == code:
-            coupon["active"] = False
-            save_discounts(data)
-            return {"success": True}
+    coupon = get_coupon_index(data).get(code)
+    if coupon:
+        coupon["active"] = False
+        save_discounts(data)
+        return {"success": True}
     
     return {"success": False, "error": "Coupon not found"}
 
 def get_discount_stats() -> Dict:
     """Get discount statistics"""
     data = load_discounts()
-    log = load_usage_log()
     
-    total_coupons = len(data.get("coupons", []))
-    active_coupons = len([c for c in data.get("coupons", []) if c.get("active")])
-    active_flash_sales = len(get_active_flash_sales())
+    coupons = data.get("coupons", [])
     
-    total_uses = sum(c.get("uses", 0) for c in data.get("coupons", []))
-    total_discount_given = sum(l.get("discount_amount", 0) for l in log)
+    total_coupons = 0
+    active_coupons = 0
+    total_uses = 0
+    for c in coupons:
+        total_coupons += 1
+        if c.get("active"):
+            active_coupons += 1
+        total_uses += c.get("uses", 0)
+    
+    active_flash_sales = len(get_active_flash_sales())
+    total_discount_given = sum(l.get("discount_amount", 0) for l in iter_usage_log())
     
     # Most popular coupons
-    popular = sorted(data.get("coupons", []), key=lambda x: x.get("uses", 0), reverse=True)[:5]
+    popular = heapq.nlargest(5, coupons, key=lambda x: x.get("uses", 0))
     
     return {
         "total_coupons": total_coupons,
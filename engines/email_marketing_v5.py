@@ -6,50 +6,161 @@ Automated email campaigns and newsletters
 
 import os
 import json
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from collections import Counter, OrderedDict
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+try:
+    from .json_io import json_dumps, write_file_atomic
+except ImportError:
+    from json_io import json_dumps, write_file_atomic
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 CAMPAIGNS_FILE = DATA_DIR / "email_campaigns.json"
 SUBSCRIBERS_FILE = DATA_DIR / "email_subscribers.json"
 TEMPLATES_FILE = DATA_DIR / "email_templates.json"
+EMAIL_SEND_URL = "http://localhost:5000/api/email/send"
+EMAIL_SEND_WORKERS = 32
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+AI_WORKERS = 8
+
+# Keep-alive session for campaign sends and OpenAI calls, sized so every worker gets a pooled connection
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=64, pool_maxsize=64))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=AI_WORKERS))
+
+# AI subject lines keyed by (topic, style); identical topics are common across campaigns.
+# Least recently used entries are dropped past SUBJECT_CACHE_SIZE; the lock covers batch worker threads
+_subject_cache = OrderedDict()
+SUBJECT_CACHE_SIZE = 256
+_subject_cache_lock = threading.Lock()
+
+FALLBACK_PRODUCT_TMPL = """
+            <div style="display: inline-block; width: 30%; margin: 1%; text-align: center; vertical-align: top;">
+                <img src="{image}" width="150" style="border-radius: 8px;">
+                <h4>{name}</h4>
+                <p style="color: #ff6b35; font-weight: bold;">${price:.2f}</p>
+            </div>
+            """
+
+FALLBACK_TMPL = """
+    <div style="font-family: 'Segoe UI', Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+        <div style="background: linear-gradient(135deg, #667eea, #764ba2); padding: 30px; text-align: center; border-radius: 16px 16px 0 0;">
+            <h1 style="color: white; margin: 0;">🐾 GetPawsy</h1>
+        </div>
+        
+        <div style="padding: 30px; background: white;">
+            <h2 style="color: #333;">{subject}</h2>
+            <p style="color: #666; line-height: 1.6;">
+                Hey there, pet lover! We have exciting news to share with you.
+                Check out our latest products and deals!
+            </p>
+            
+            {products_html}
+            
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="https://getpawsy.pet" style="background: linear-gradient(135deg, #ff6b35, #f7931e); color: white; padding: 15px 40px; border-radius: 30px; text-decoration: none; font-weight: bold;">
+                    Shop Now →
+                </a>
+            </div>
+        </div>
+        
+        <div style="background: #f9f9f9; padding: 20px; text-align: center; border-radius: 0 0 16px 16px;">
+            <p style="color: #999; font-size: 12px;">© 2025 GetPawsy | Made with ❤️ for pet lovers</p>
+        </div>
+    </div>
+    """
+
+# Read once at import; the environment does not change while an engine runs
+_OPENAI_KEY = os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
 
 def get_openai_key():
-    return os.environ.get("AI_INTEGRATIONS_OPENAI_API_KEY") or os.environ.get("OPENAI_API_KEY")
+    return _OPENAI_KEY
+
+# Parsed JSON files keyed by path, each reused until the file's mtime changes
+_json_cache = {}
+
+def load_json_cached(path: Path):
+    """Parse a JSON file, reusing the previous result while its mtime is unchanged"""
+    mtime = path.stat().st_mtime_ns
+    cached = _json_cache.get(path)
+    if cached is None or cached["mtime"] != mtime:
+        with open(path, "rb") as f:
+            cached = {"mtime": mtime, "data": json.load(f)}
+        _json_cache[path] = cached
+    return cached["data"]
+
+def save_json_cached(path: Path, data):
+    """Write a JSON file and keep the written data as its cached parse"""
+    write_file_atomic(path, json_dumps(data))
+    _json_cache[path] = {"mtime": path.stat().st_mtime_ns, "data": data}
 
 def load_campaigns() -> Dict:
     """Load email campaigns"""
     if CAMPAIGNS_FILE.exists():
-        with open(CAMPAIGNS_FILE, "r") as f:
-            return json.load(f)
+        return load_json_cached(CAMPAIGNS_FILE)
     return {"campaigns": [], "automations": []}
 
 def save_campaigns(data: Dict):
     """Save campaigns"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(CAMPAIGNS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    save_json_cached(CAMPAIGNS_FILE, data)
 
 def load_subscribers() -> Dict:
     """Load email subscribers"""
     if SUBSCRIBERS_FILE.exists():
-        with open(SUBSCRIBERS_FILE, "r") as f:
-            return json.load(f)
+        return load_json_cached(SUBSCRIBERS_FILE)
     return {"subscribers": [], "segments": []}
 
 def save_subscribers(data: Dict):
     """Save subscribers"""
-    with open(SUBSCRIBERS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    save_json_cached(SUBSCRIBERS_FILE, data)
+    # Subscribers may have changed status, pet type or tags in place
+    _segment_index["data"] = None
+
+# Subscribers keyed by email, rebuilt whenever a different subscribers dict is loaded
+_subscriber_index = {"data": None, "index": None}
+
+def get_subscriber_index(data: Dict) -> Dict[str, Dict]:
+    """Map email -> subscriber dict for the given subscribers data"""
+    if _subscriber_index["data"] is not data:
+        index = {}
+        for sub in data.get("subscribers", []):
+            index.setdefault(sub["email"], sub)
+        _subscriber_index["index"] = index
+        _subscriber_index["data"] = data
+    return _subscriber_index["index"]
+
+# Active subscribers, plus inverted indexes by pet type and tag, for segment targeting
+_segment_index = {"data": None, "active": [], "by_pet": {}, "by_tag": {}}
+
+def get_segment_index(data: Dict) -> Dict:
+    """Active subscribers grouped by pet_type and by tag, in subscriber order"""
+    if _segment_index["data"] is not data:
+        active = []
+        by_pet = {}
+        by_tag = {}
+        for sub in data.get("subscribers", []):
+            if sub.get("status") != "active":
+                continue
+            active.append(sub)
+            by_pet.setdefault(sub.get("pet_type"), []).append(sub)
+            for tag in set(sub.get("tags", [])):
+                by_tag.setdefault(tag, []).append(sub)
+        _segment_index.update(data=data, active=active, by_pet=by_pet, by_tag=by_tag)
+    return _segment_index
 
 def load_templates() -> List[Dict]:
     """Load email templates"""
     if TEMPLATES_FILE.exists():
-        with open(TEMPLATES_FILE, "r") as f:
-            return json.load(f)
+        return load_json_cached(TEMPLATES_FILE)
     
     # Default templates
     default_templates = [
@@ -83,15 +194,15 @@ def load_templates() -> List[Dict]:
 
 def save_templates(templates: List[Dict]):
     """Save templates"""
-    with open(TEMPLATES_FILE, "w") as f:
-        json.dump(templates, f, indent=2)
+    save_json_cached(TEMPLATES_FILE, templates)
 
 def subscribe(email: str, name: str = "", pet_type: str = None, source: str = "website") -> Dict:
     """Add email subscriber"""
     data = load_subscribers()
     
     # Check if already subscribed
-    existing = next((s for s in data["subscribers"] if s["email"] == email), None)
+    index = get_subscriber_index(data)
+    existing = index.get(email)
     if existing:
         if existing.get("status") == "unsubscribed":
             existing["status"] = "active"
@@ -114,6 +225,7 @@ def subscribe(email: str, name: str = "", pet_type: str = None, source: str = "w
     }
     
     data["subscribers"].append(subscriber)
+    index[email] = subscriber
     save_subscribers(data)
     
     return {"success": True, "subscriber": subscriber}
@@ -122,12 +234,12 @@ def unsubscribe(email: str) -> Dict:
     """Unsubscribe email"""
     data = load_subscribers()
     
-    for sub in data["subscribers"]:
-        if sub["email"] == email:
-            sub["status"] = "unsubscribed"
-            sub["unsubscribed_at"] = datetime.now().isoformat()
-            save_subscribers(data)
-            return {"success": True}
+    sub = get_subscriber_index(data).get(email)
+    if sub:
+        sub["status"] = "unsubscribed"
+        sub["unsubscribed_at"] = datetime.now().isoformat()
+        save_subscribers(data)
+        return {"success": True}
     
     return {"success": False, "error": "Subscriber not found"}
 
@@ -135,33 +247,36 @@ def add_tag(email: str, tag: str) -> Dict:
     """Add tag to subscriber"""
     data = load_subscribers()
     
-    for sub in data["subscribers"]:
-        if sub["email"] == email:
-            if tag not in sub.get("tags", []):
-                sub["tags"] = sub.get("tags", []) + [tag]
-                save_subscribers(data)
-            return {"success": True}
+    sub = get_subscriber_index(data).get(email)
+    if sub:
+        tags = sub.setdefault("tags", [])
+        if tag not in tags:
+            tags.append(tag)
+            save_subscribers(data)
+        return {"success": True}
     
     return {"success": False, "error": "Subscriber not found"}
 
 def get_segment(segment_rules: Dict) -> List[Dict]:
     """Get subscribers matching segment rules"""
-    data = load_subscribers()
-    subscribers = [s for s in data["subscribers"] if s.get("status") == "active"]
-    
-    # Filter by pet type
-    if segment_rules.get("pet_type"):
-        subscribers = [s for s in subscribers if s.get("pet_type") == segment_rules["pet_type"]]
-    
-    # Filter by tags
-    if segment_rules.get("has_tag"):
-        subscribers = [s for s in subscribers if segment_rules["has_tag"] in s.get("tags", [])]
-    
-    # Filter by engagement
-    if segment_rules.get("min_opens"):
-        subscribers = [s for s in subscribers if s.get("opens", 0) >= segment_rules["min_opens"]]
-    
-    return subscribers
+    index = get_segment_index(load_subscribers())
+    pet_type = segment_rules.get("pet_type")
+    has_tag = segment_rules.get("has_tag")
+    min_opens = segment_rules.get("min_opens")
+    
+    # Start from the smallest indexed pool, then apply the remaining filters
+    pools = [index["active"]]
+    if pet_type:
+        pools.append(index["by_pet"].get(pet_type, []))
+    if has_tag:
+        pools.append(index["by_tag"].get(has_tag, []))
+    
+    return [
+        s for s in min(pools, key=len)
+        if (not pet_type or s.get("pet_type") == pet_type)
+        and (not has_tag or has_tag in s.get("tags", []))
+        and (not min_opens or s.get("opens", 0) >= min_opens)
+    ]
 
 def generate_ai_subject(topic: str, style: str = "engaging") -> str:
     """Generate email subject line using AI"""
@@ -169,9 +284,15 @@ def generate_ai_subject(topic: str, style: str = "engaging") -> str:
     if not api_key:
         return f"🐾 {topic} - GetPawsy"
     
+    cache_key = (topic, style)
+    with _subject_cache_lock:
+        if cache_key in _subject_cache:
+            _subject_cache.move_to_end(cache_key)
+            return _subject_cache[cache_key]
+    
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        response = _SESSION.post(
+            OPENAI_CHAT_URL,
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
@@ -195,12 +316,28 @@ def generate_ai_subject(topic: str, style: str = "engaging") -> str:
         )
         
         if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"].strip()
+            subject = response.json()["choices"][0]["message"]["content"].strip()
+            with _subject_cache_lock:
+                _subject_cache[cache_key] = subject
+                if len(_subject_cache) > SUBJECT_CACHE_SIZE:
+                    _subject_cache.popitem(last=False)
+            return subject
     except:
         pass
     
     return f"🐾 {topic} - GetPawsy"
 
+def generate_ai_subjects_batch(topics: List[str], style: str = "engaging") -> List[str]:
+    """Generate subject lines for several topics in parallel, in topic order"""
+    unique_topics = list(dict.fromkeys(topics))
+    if not unique_topics:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(AI_WORKERS, len(unique_topics))) as executor:
+        subjects = dict(zip(unique_topics, executor.map(lambda t: generate_ai_subject(t, style), unique_topics)))
+    
+    return [subjects[topic] for topic in topics]
+
 def generate_ai_email_content(subject: str, type: str = "promotional", products: List[Dict] = None) -> str:
     """Generate email content using AI"""
     api_key = get_openai_key()
@@ -216,8 +353,8 @@ def generate_ai_email_content(subject: str, type: str = "promotional", products:
         return get_fallback_template(subject, products)
     
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
+        response = _SESSION.post(
+            OPENAI_CHAT_URL,
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
@@ -251,46 +388,37 @@ Return only the HTML body content (no <html> or <body> tags)."""
     
     return get_fallback_template(subject, products)
 
+def generate_ai_email_contents_batch(subjects: List[str], type: str = "promotional", products: List[Dict] = None) -> List[str]:
+    """Generate email content for several subjects in parallel, in subject order"""
+    unique_subjects = list(dict.fromkeys(subjects))
+    if not unique_subjects:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(AI_WORKERS, len(unique_subjects))) as executor:
+        contents = dict(zip(unique_subjects, executor.map(lambda s: generate_ai_email_content(s, type, products), unique_subjects)))
+    
+    return [contents[subject] for subject in subjects]
+
 def get_fallback_template(subject: str, products: List[Dict] = None) -> str:
     """Fallback email template"""
-    products_html = ""
-    if products:
-        for p in products[:3]:
-            products_html += f"""
-            <div style="display: inline-block; width: 30%; margin: 1%; text-align: center; vertical-align: top;">
-                <img src="{p.get('image', '')}" width="150" style="border-radius: 8px;">
-                <h4>{p.get('name', 'Product')}</h4>
-                <p style="color: #ff6b35; font-weight: bold;">${p.get('price', 0):.2f}</p>
-            </div>
-            """
-    
-    return f"""
-    <div style="font-family: 'Segoe UI', Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea, #764ba2); padding: 30px; text-align: center; border-radius: 16px 16px 0 0;">
-            <h1 style="color: white; margin: 0;">🐾 GetPawsy</h1>
-        </div>
-        
-        <div style="padding: 30px; background: white;">
-            <h2 style="color: #333;">{subject}</h2>
-            <p style="color: #666; line-height: 1.6;">
-                Hey there, pet lover! We have exciting news to share with you.
-                Check out our latest products and deals!
-            </p>
-            
-            {products_html}
-            
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="https://getpawsy.pet" style="background: linear-gradient(135deg, #ff6b35, #f7931e); color: white; padding: 15px 40px; border-radius: 30px; text-decoration: none; font-weight: bold;">
-                    Shop Now →
-                </a>
-            </div>
-        </div>
-        
-        <div style="background: #f9f9f9; padding: 20px; text-align: center; border-radius: 0 0 16px 16px;">
-            <p style="color: #999; font-size: 12px;">© 2025 GetPawsy | Made with ❤️ for pet lovers</p>
-        </div>
-    </div>
-    """
+    cards = tuple(
+        (p.get('image', ''), p.get('name', 'Product'), p.get('price', 0))
+        for p in (products or [])[:3]
+    )
+    try:
+        return render_fallback_template(subject, cards)
+    except TypeError:
+        # A list or dict field can't be a cache key; render it without the cache
+        return render_fallback_template.__wrapped__(subject, cards)
+
+@lru_cache(maxsize=256)
+def render_fallback_template(subject: str, cards: tuple) -> str:
+    """Render the fallback email for (image, name, price) product cards"""
+    products_html = "".join(
+        FALLBACK_PRODUCT_TMPL.format(image=image, name=name, price=price)
+        for image, name, price in cards
+    )
+    return FALLBACK_TMPL.format(subject=subject, products_html=products_html)
 
 def create_campaign(name: str, subject: str, content: str, segment: Dict = None, scheduled_for: str = None) -> Dict:
     """Create an email campaign"""
@@ -321,7 +449,11 @@ def create_campaign(name: str, subject: str, content: str, segment: Dict = None,
     return {"success": True, "campaign": campaign}
 
 def send_campaign(campaign_id: str) -> Dict:
-    """Send an email campaign"""
+    """Send an email campaign
+    
+    Send outcomes are tallied in memory and the campaign is saved once after every
+    send has finished; individual sends must never write campaign state themselves.
+    """
     data = load_campaigns()
     campaign = next((c for c in data["campaigns"] if c["id"] == campaign_id), None)
     
@@ -334,29 +466,29 @@ def send_campaign(campaign_id: str) -> Dict:
     # Get subscribers
     subscribers = get_segment(campaign.get("segment", {}))
     
-    sent_count = 0
-    for sub in subscribers:
-        try:
-            requests.post(
-                "http://localhost:5000/api/email/send",
-                json={
-                    "to": sub["email"],
-                    "subject": campaign["subject"],
-                    "html": wrap_email_html(campaign["content"])
-                },
-                timeout=5
-            )
-            sent_count += 1
-        except:
-            continue
-    
-    # Update campaign
+    # Only the recipient differs between sends
+    base_payload = {
+        "subject": campaign["subject"],
+        "html": wrap_email_html(campaign["content"])
+    }
+    
+    def send_one(sub):
+        _SESSION.post(EMAIL_SEND_URL, json={**base_payload, "to": sub["email"]}, timeout=5)
+    
+    outcomes = Counter()
+    if subscribers:
+        with ThreadPoolExecutor(max_workers=min(EMAIL_SEND_WORKERS, len(subscribers))) as executor:
+            futures = [executor.submit(send_one, sub) for sub in subscribers]
+            for future in as_completed(futures):
+                outcomes["sent" if future.exception() is None else "failed"] += 1
+    
+    # Update campaign once, after all sends are done
     campaign["status"] = "sent"
     campaign["sent_at"] = datetime.now().isoformat()
-    campaign["stats"]["sent"] = sent_count
+    campaign["stats"]["sent"] = outcomes["sent"]
     save_campaigns(data)
     
-    return {"success": True, "sent": sent_count}
+    return {"success": True, "sent": outcomes["sent"]}
 
 def wrap_email_html(content: str) -> str:
     """Wrap content in email template"""
@@ -378,16 +510,22 @@ def get_campaign_stats() -> Dict:
     data = load_campaigns()
     subs = load_subscribers()
     
-    total_campaigns = len(data.get("campaigns", []))
-    sent_campaigns = len([c for c in data.get("campaigns", []) if c.get("status") == "sent"])
-    
-    total_sent = sum(c.get("stats", {}).get("sent", 0) for c in data.get("campaigns", []))
-    total_opened = sum(c.get("stats", {}).get("opened", 0) for c in data.get("campaigns", []))
+    total_campaigns = 0
+    sent_campaigns = 0
+    total_sent = 0
+    total_opened = 0
+    for c in data.get("campaigns", []):
+        total_campaigns += 1
+        if c.get("status") == "sent":
+            sent_campaigns += 1
+        stats = c.get("stats", {})
+        total_sent += stats.get("sent", 0)
+        total_opened += stats.get("opened", 0)
     
     return {
         "total_campaigns": total_campaigns,
         "sent_campaigns": sent_campaigns,
-        "total_subscribers": len([s for s in subs.get("subscribers", []) if s.get("status") == "active"]),
+        "total_subscribers": sum(1 for s in subs.get("subscribers", []) if s.get("status") == "active"),
         "total_sent": total_sent,
         "total_opened": total_opened,
         "open_rate": (total_opened / total_sent * 100) if total_sent > 0 else 0
@@ -4,6 +4,7 @@ Heal Engine - Checks and restores critical files
 """
 import os
 import json
+import atexit
 from datetime import datetime
 
 LOG_FILE = "logs/heal.log"
@@ -30,39 +31,37 @@ CRITICAL_DIRS = [
 def ensure_log_dir():
     os.makedirs("logs", exist_ok=True)
 
+_LOG_FP = None
+
 def log(message):
-    ensure_log_dir()
+    global _LOG_FP
+    if _LOG_FP is None:
+        ensure_log_dir()
+        _LOG_FP = open(LOG_FILE, "a", buffering=64 * 1024)
+        atexit.register(_LOG_FP.close)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}\n"
-    with open(LOG_FILE, "a") as f:
-        f.write(log_entry)
+    _LOG_FP.write(log_entry)
     print(log_entry.strip())
 
 def check_file(filepath):
-    exists = os.path.exists(filepath)
-    if exists:
-        size = os.path.getsize(filepath)
-        return {"exists": True, "size": size, "status": "OK"}
-    return {"exists": False, "size": 0, "status": "MISSING"}
+    # One stat gives both existence and size
+    try:
+        size = os.stat(filepath).st_size
+    except OSError:
+        return {"exists": False, "size": 0, "status": "MISSING"}
+    return {"exists": True, "size": size, "status": "OK"}
 
 def check_directory(dirpath):
-    exists = os.path.isdir(dirpath)
-    if exists:
-        try:
-            count = len(os.listdir(dirpath))
-            return {"exists": True, "files": count, "status": "OK"}
-        except:
-            return {"exists": True, "files": 0, "status": "EMPTY"}
-    return {"exists": False, "files": 0, "status": "MISSING"}
-
-def create_missing_dirs():
-    created = 0
-    for dir_path in CRITICAL_DIRS:
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path, exist_ok=True)
-            log(f"Created missing directory: {dir_path}")
-            created += 1
-    return created
+    # Count entries while scanning instead of isdir + materializing listdir
+    try:
+        with os.scandir(dirpath) as entries:
+            count = sum(1 for _ in entries)
+        return {"exists": True, "files": count, "status": "OK"}
+    except (FileNotFoundError, NotADirectoryError):
+        return {"exists": False, "files": 0, "status": "MISSING"}
+    except OSError:
+        return {"exists": True, "files": 0, "status": "EMPTY"}
 
 def restore_version_json():
     if not os.path.exists("version.json"):
@@ -89,6 +88,7 @@ def run_health_check():
         "issues_fixed": 0
     }
     
+    # Issues are healed as they are found, so each path is only checked once
     log("Checking critical files...")
     for filepath in CRITICAL_FILES:
         status = check_file(filepath)
@@ -96,6 +96,8 @@ def run_health_check():
         if status["status"] != "OK":
             health_report["issues_found"] += 1
             log(f"  MISSING: {filepath}")
+            if filepath == "version.json" and restore_version_json():
+                health_report["issues_fixed"] += 1
         else:
             log(f"  OK: {filepath}")
     
@@ -106,17 +108,14 @@ def run_health_check():
         if status["status"] != "OK":
             health_report["issues_found"] += 1
             log(f"  MISSING: {dirpath}")
+            # A file squatting on the directory name is reported but left alone
+            if not status["exists"] and not os.path.lexists(dirpath):
+                os.makedirs(dirpath, exist_ok=True)
+                log(f"Created missing directory: {dirpath}")
+                health_report["issues_fixed"] += 1
         else:
             log(f"  OK: {dirpath} ({status['files']} files)")
     
-    log("Attempting to heal issues...")
-    
-    dirs_created = create_missing_dirs()
-    health_report["issues_fixed"] += dirs_created
-    
-    if restore_version_json():
-        health_report["issues_fixed"] += 1
-    
     overall_status = "HEALTHY" if health_report["issues_found"] == 0 else "NEEDS_ATTENTION"
     health_report["overall_status"] = overall_status
     
@@ -126,9 +125,12 @@ def run_health_check():
     log(f"Overall status: {overall_status}")
     
     report_file = "logs/health_report.json"
-    with open(report_file, "w") as f:
-        json.dump(health_report, f, indent=2)
+    tmp_file = report_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        f.write(json.dumps(health_report, indent=2))
+    os.replace(tmp_file, report_file)
     log(f"Health report saved to {report_file}")
+    _LOG_FP.flush()
     
     return health_report
 
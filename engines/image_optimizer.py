@@ -3,70 +3,139 @@
 Image Optimizer - Optimizes all images in public/images/
 """
 import os
+import atexit
 from datetime import datetime
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 LOG_FILE = "logs/optimize.log"
 IMAGES_DIR = "public/images"
 SUPPORTED_FORMATS = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
+SUPPORTED_SUFFIXES = tuple(SUPPORTED_FORMATS)
+OPTIMIZABLE_EXTENSIONS = frozenset([".png", ".jpg", ".jpeg"])
+LARGE_FILE_BYTES = 500 * 1024
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
 def ensure_log_dir():
     os.makedirs("logs", exist_ok=True)
 
+_LOG_FP = None
+
 def log(message):
-    ensure_log_dir()
+    global _LOG_FP
+    if _LOG_FP is None:
+        ensure_log_dir()
+        _LOG_FP = open(LOG_FILE, "a", buffering=64 * 1024)
+        atexit.register(_LOG_FP.close)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}\n"
-    with open(LOG_FILE, "a") as f:
-        f.write(log_entry)
+    _LOG_FP.write(log_entry)
     print(log_entry.strip())
 
+def image_extension(name):
+    """Lowercased extension if name is a supported image, else None"""
+    name = name.lower()
+    if not name.endswith(SUPPORTED_SUFFIXES):
+        return None
+    dot = name.rfind(".")
+    # Like splitext, a name that is only dots plus the suffix (".png") has no extension
+    if not name[:dot].lstrip("."):
+        return None
+    return name[dot:]
+
+def scan_images(root):
+    # Same order as os.walk: a directory's files first, then its subdirectories.
+    # Yields (path, size, ext) so callers never stat a file a second time.
+    if hasattr(os, "fwalk"):
+        # fwalk hands back each directory's fd, so stats resolve only the file name
+        for dirpath, _dirnames, filenames, dir_fd in os.fwalk(root):
+            for name in filenames:
+                ext = image_extension(name)
+                if ext is None:
+                    continue
+                try:
+                    size = os.stat(name, dir_fd=dir_fd).st_size
+                except OSError:
+                    size = 0
+                yield os.path.join(dirpath, name), size, ext
+        return
+    
+    # No fwalk (Windows): scandir, where DirEntry.stat is served from the listing
+    subdirs = []
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                ext = image_extension(entry.name)
+                if ext is None:
+                    continue
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    size = 0
+                yield entry.path, size, ext
+    except OSError:
+        return
+    for subdir in subdirs:
+        yield from scan_images(subdir)
+
 def get_image_files():
-    images = []
     if not os.path.exists(IMAGES_DIR):
         log(f"Images directory not found: {IMAGES_DIR}")
-        return images
-    
-    for root, dirs, files in os.walk(IMAGES_DIR):
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext in SUPPORTED_FORMATS:
-                images.append(os.path.join(root, file))
+        return iter(())
     
-    return images
-
-def get_file_size(filepath):
-    if os.path.exists(filepath):
-        return os.path.getsize(filepath)
-    return 0
+    return scan_images(IMAGES_DIR)
 
 def analyze_images():
-    images = get_image_files()
-    log(f"Found {len(images)} images to analyze")
-    
     stats = {
-        "total_files": len(images),
+        "total_files": 0,
         "total_size": 0,
         "large_files": [],
         "optimizable": []
     }
     
-    for img_path in images:
-        size = get_file_size(img_path)
+    # One pass over the scan: count, size and classify each image as it is found
+    for img_path, size, ext in get_image_files():
+        stats["total_files"] += 1
         stats["total_size"] += size
         
-        if size > 500 * 1024:
+        if size > LARGE_FILE_BYTES:
             stats["large_files"].append({
                 "path": img_path,
                 "size_kb": round(size / 1024, 2)
             })
         
-        ext = os.path.splitext(img_path)[1].lower()
-        if ext in [".png", ".jpg", ".jpeg"] and not img_path.endswith(".webp"):
+        if ext in OPTIMIZABLE_EXTENSIONS:
             stats["optimizable"].append(img_path)
     
+    log(f"Found {stats['total_files']} images to analyze")
     return stats
 
+def copy_variant(src, dst):
+    """copy2, but let the kernel clone the data with copy_file_range where it can"""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                # Reflinks on btrfs/XFS, server-side copy on NFS 4.2, in-kernel copy elsewhere
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                shutil.copystat(src, dst)
+                return dst
+            # A short copy means the filesystem gave up without raising; don't keep a truncated variant
+            os.remove(dst)
+        except OSError:
+            # Unsupported filesystem pair or kernel: fall through to shutil's sendfile path
+            pass
+    return shutil.copy2(src, dst)
+
 def create_mobile_variants():
     log("Creating mobile image variants...")
     
@@ -78,17 +147,23 @@ def create_mobile_variants():
     mobile_dir = os.path.join(hero_dir, "mobile")
     os.makedirs(mobile_dir, exist_ok=True)
     
-    created = 0
-    for file in os.listdir(hero_dir):
-        if os.path.isfile(os.path.join(hero_dir, file)):
-            src = os.path.join(hero_dir, file)
-            dst = os.path.join(mobile_dir, f"mobile_{file}")
-            if not os.path.exists(dst):
-                shutil.copy2(src, dst)
-                created += 1
-                log(f"Created mobile variant: {dst}")
+    copies = []
+    with os.scandir(hero_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                dst = os.path.join(mobile_dir, f"mobile_{entry.name}")
+                if not os.path.exists(dst):
+                    copies.append((entry.path, dst))
+    
+    if not copies:
+        return 0
+    
+    # copy2 spends its time in the kernel (sendfile), so threads overlap the copies
+    with ThreadPoolExecutor(max_workers=min(COPY_WORKERS, len(copies))) as executor:
+        for dst in executor.map(lambda job: copy_variant(*job), copies):
+            log(f"Created mobile variant: {dst}")
     
-    return created
+    return len(copies)
 
 def run_optimization():
     log("=== Image Optimizer Started ===")
@@ -107,6 +182,7 @@ def run_optimization():
     
     log("=== Image Optimizer Complete ===")
     log("Note: For full WebP conversion, install Pillow: pip install Pillow")
+    _LOG_FP.flush()
     
     return {
         "analyzed": stats["total_files"],
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+GetPawsy JSON file helpers shared by the engines
+orjson when it is installed, stdlib json otherwise
+"""
+
+import os
+import json
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(raw):
+    """Parse JSON text or bytes"""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals or integers past 64 bits, which stdlib json still reads
+            pass
+    return json.loads(raw)
+
+def json_dumps(data, indent: bool = False) -> bytes:
+    """Serialize to JSON bytes, compact or indented like json.dump(indent=2)"""
+    if orjson is not None:
+        # Non-string keys are written as strings, as stdlib json does
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if indent:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def json_dumps_line(data) -> bytes:
+    """Serialize to one compact, newline-terminated JSON line"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return json_dumps(data) + b"\n"
+
+def write_file_atomic(path: Path, content: bytes):
+    """Write bytes via a temp file and os.replace so readers never see a partial file"""
+    # Per-process temp name: several engines write the same data files from different processes
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
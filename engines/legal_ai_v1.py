@@ -5,109 +5,69 @@ AI-powered legal page management for US-compliant e-commerce
 
 import os
 import json
+import hashlib
+from collections import OrderedDict, deque
 from datetime import datetime
 
-def get_openai_client():
-    try:
-        from openai import OpenAI
-        return OpenAI()
-    except:
-        return None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def read_legal_page(page_name):
-    slug_map = {'ai': 'ai_disclosure', 'eu-gdpr': 'eu_gdpr', 'california-ai': 'california_age_ai', 'accessibility': 'ada_accessibility', 'pet-safety': 'pet_safety'}
-    page_name = slug_map.get(page_name, page_name)
-    
-    page_map = {
-        'terms': 'terms.ejs',
-        'privacy': 'privacy.ejs',
-        'returns': 'returns.ejs',
-        'shipping': 'shipping.ejs',
-        'refund': 'refund.ejs',
-        'about': 'about.ejs',
-        'cookies': 'cookies.ejs',
-        'ai_disclosure': 'ai_disclosure.ejs',
-        'eu_gdpr': 'eu_gdpr.ejs',
-        'california_age_ai': 'california_age_ai.ejs',
-        'ada_accessibility': 'ada_accessibility.ejs',
-        'pet_safety': 'pet_safety.ejs'
-    }
-    
-    filename = page_map.get(page_name, f'{page_name}.ejs')
-    filepath = os.path.join(os.path.dirname(__file__), '..', 'views', 'legal', filename)
-    
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return {'success': True, 'content': f.read(), 'path': filepath}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+MODULE_DIR = os.path.dirname(__file__)
+LEGAL_DIR = os.path.join(MODULE_DIR, '..', 'views', 'legal')
+DATA_DIR = os.path.join(MODULE_DIR, '..', 'data')
+BACKUP_DIR = os.path.join(DATA_DIR, 'legal_backups')
 
-def save_legal_page(page_name, content):
-    slug_map = {'ai': 'ai_disclosure', 'eu-gdpr': 'eu_gdpr', 'california-ai': 'california_age_ai', 'accessibility': 'ada_accessibility', 'pet-safety': 'pet_safety'}
-    page_name = slug_map.get(page_name, page_name)
-    
-    page_map = {
-        'terms': 'terms.ejs',
-        'privacy': 'privacy.ejs',
-        'returns': 'returns.ejs',
-        'shipping': 'shipping.ejs',
-        'refund': 'refund.ejs',
-        'about': 'about.ejs',
-        'cookies': 'cookies.ejs',
-        'ai_disclosure': 'ai_disclosure.ejs',
-        'eu_gdpr': 'eu_gdpr.ejs',
-        'california_age_ai': 'california_age_ai.ejs',
-        'ada_accessibility': 'ada_accessibility.ejs',
-        'pet_safety': 'pet_safety.ejs'
-    }
-    
-    filename = page_map.get(page_name, f'{page_name}.ejs')
-    filepath = os.path.join(os.path.dirname(__file__), '..', 'views', 'legal', filename)
-    
-    backup_dir = os.path.join(os.path.dirname(__file__), '..', 'data', 'legal_backups')
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    try:
-        if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                old_content = f.read()
-            backup_path = os.path.join(backup_dir, f'{page_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.ejs')
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                f.write(old_content)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        return {'success': True, 'message': 'Page saved successfully'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+_SLUG_MAP = {'ai': 'ai_disclosure', 'eu-gdpr': 'eu_gdpr', 'california-ai': 'california_age_ai', 'accessibility': 'ada_accessibility', 'pet-safety': 'pet_safety'}
 
-def ai_rewrite_page(page_name, current_content, action='rewrite'):
-    slug_map = {'ai': 'ai_disclosure', 'eu-gdpr': 'eu_gdpr', 'california-ai': 'california_age_ai', 'accessibility': 'ada_accessibility', 'pet-safety': 'pet_safety'}
-    page_name = slug_map.get(page_name, page_name)
-    
-    client = get_openai_client()
-    
-    if not client:
-        return {'success': False, 'error': 'OpenAI client not available'}
-    
-    page_descriptions = {
-        'terms': 'Terms and Conditions for an e-commerce pet products store',
-        'privacy': 'Privacy Policy covering CCPA and GDPR compliance',
-        'returns': 'Return Policy for pet products (30-day returns)',
-        'shipping': 'Shipping Policy for US-only delivery',
-        'refund': 'Refund Policy with processing times and conditions',
-        'about': 'About Us page for a pet products company called GetPawsy',
-        'cookies': 'Cookie Policy for website tracking and personalization',
-        'ai_disclosure': 'AI Transparency Notice explaining AI usage in the store',
-        'eu_gdpr': 'GDPR Addendum for EU customers with data protection rights',
-        'california_age_ai': 'California CPRA and Age-Appropriate Design Code compliance',
-        'ada_accessibility': 'ADA Accessibility Statement with WCAG 2.1 AA commitment',
-        'pet_safety': 'Pet Product Safety Disclaimer with choking hazards and supervision notices'
-    }
-    
-    action_prompts = {
-        'rewrite': f"""Completely rewrite this {page_descriptions.get(page_name, 'legal page')} for GetPawsy, a US-based e-commerce pet products store.
+_PAGE_MAP = {
+    'terms': 'terms.ejs',
+    'privacy': 'privacy.ejs',
+    'returns': 'returns.ejs',
+    'shipping': 'shipping.ejs',
+    'refund': 'refund.ejs',
+    'about': 'about.ejs',
+    'cookies': 'cookies.ejs',
+    'ai_disclosure': 'ai_disclosure.ejs',
+    'eu_gdpr': 'eu_gdpr.ejs',
+    'california_age_ai': 'california_age_ai.ejs',
+    'ada_accessibility': 'ada_accessibility.ejs',
+    'pet_safety': 'pet_safety.ejs'
+}
+
+def _resolve_path(page_name):
+    name = _SLUG_MAP.get(page_name, page_name)
+    return os.path.join(LEGAL_DIR, _PAGE_MAP.get(name, f'{name}.ejs'))
+
+AI_LOG_FILE = os.path.join(DATA_DIR, 'legal_ai_logs.jsonl')
+LEGACY_AI_LOG_FILE = os.path.join(DATA_DIR, 'legal_ai_logs.json')
+AI_LOG_LIMIT = 100
+# Roughly ten times AI_LOG_LIMIT entries before the log is trimmed back down
+AI_LOG_COMPACT_BYTES = 128 * 1024
+
+LEGAL_SYSTEM_PROMPT = """You are a legal content specialist for US e-commerce businesses. 
+You create professional, compliant legal pages that protect businesses while being readable.
+Always preserve EJS template syntax like <%- include('partials/header') %>.
+Output only the complete page content, no explanations."""
+
+_PAGE_DESCRIPTIONS = {
+    'terms': 'Terms and Conditions for an e-commerce pet products store',
+    'privacy': 'Privacy Policy covering CCPA and GDPR compliance',
+    'returns': 'Return Policy for pet products (30-day returns)',
+    'shipping': 'Shipping Policy for US-only delivery',
+    'refund': 'Refund Policy with processing times and conditions',
+    'about': 'About Us page for a pet products company called GetPawsy',
+    'cookies': 'Cookie Policy for website tracking and personalization',
+    'ai_disclosure': 'AI Transparency Notice explaining AI usage in the store',
+    'eu_gdpr': 'GDPR Addendum for EU customers with data protection rights',
+    'california_age_ai': 'California CPRA and Age-Appropriate Design Code compliance',
+    'ada_accessibility': 'ADA Accessibility Statement with WCAG 2.1 AA commitment',
+    'pet_safety': 'Pet Product Safety Disclaimer with choking hazards and supervision notices'
+}
+
+_PROMPT_TEMPLATES = {
+    'rewrite': """Completely rewrite this {desc} for GetPawsy, a US-based e-commerce pet products store.
         
 Requirements:
 - Use Delaware as governing law state
@@ -119,9 +79,9 @@ Requirements:
 - Keep similar HTML structure and CSS classes
 
 Current content:
-{current_content}""",
+{content}""",
 
-        'update': f"""Update this {page_descriptions.get(page_name, 'legal page')} to match the latest US regulations (2024-2025).
+    'update': """Update this {desc} to match the latest US regulations (2024-2025).
 
 Requirements:
 - Keep the existing structure and style
@@ -131,9 +91,9 @@ Requirements:
 - Preserve the EJS template structure
 
 Current content:
-{current_content}""",
+{content}""",
 
-        'simplify': f"""Simplify this {page_descriptions.get(page_name, 'legal page')} to be more readable and user-friendly.
+    'simplify': """Simplify this {desc} to be more readable and user-friendly.
 
 Requirements:
 - Use plain English instead of legal jargon
@@ -143,9 +103,9 @@ Requirements:
 - Preserve the EJS template structure and HTML
 
 Current content:
-{current_content}""",
+{content}""",
 
-        'summarize': f"""Add a brief summary section at the top of this {page_descriptions.get(page_name, 'legal page')}.
+    'summarize': """Add a brief summary section at the top of this {desc}.
 
 Requirements:
 - Add a "Key Points" or "Summary" section after the header
@@ -154,69 +114,172 @@ Requirements:
 - Preserve the EJS template structure
 
 Current content:
-{current_content}"""
-    }
+{content}"""
+}
+
+def split_template(template):
+    head, rest = template.split('{desc}')
+    middle, tail = rest.split('{content}')
+    return head, middle, tail
+
+# Templates pre-split around {desc} and {content}, so building a prompt is a single join
+_PROMPT_PARTS = {action: split_template(template) for action, template in _PROMPT_TEMPLATES.items()}
+
+# (page_name, action, sha1 of current content) -> rewritten content, least recently used first
+_REWRITE_CACHE = OrderedDict()
+REWRITE_CACHE_SIZE = 32
+
+# Set once BACKUP_DIR has been created, so later saves skip the makedirs stats
+_backup_dir_ready = False
+
+# filepath -> (st_mtime_ns, st_size, content) for legal pages already read
+_PAGE_CACHE = {}
+
+def read_page_file(filepath):
+    st = os.stat(filepath)
+    cached = _PAGE_CACHE.get(filepath)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+    _PAGE_CACHE[filepath] = (st.st_mtime_ns, st.st_size, content)
+    return content
+
+def get_openai_client():
+    try:
+        from openai import OpenAI
+        return OpenAI()
+    except:
+        return None
+
+def read_legal_page(page_name):
+    filepath = _resolve_path(page_name)
     
-    prompt = action_prompts.get(action, action_prompts['rewrite'])
+    try:
+        return {'success': True, 'content': read_page_file(filepath), 'path': filepath}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def save_legal_page(page_name, content):
+    page_name = _SLUG_MAP.get(page_name, page_name)
+    filepath = _resolve_path(page_name)
+    
+    global _backup_dir_ready
+    if not _backup_dir_ready:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        _backup_dir_ready = True
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are a legal content specialist for US e-commerce businesses. 
-You create professional, compliant legal pages that protect businesses while being readable.
-Always preserve EJS template syntax like <%- include('partials/header') %>.
-Output only the complete page content, no explanations."""
-                },
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=4000,
-            temperature=0.3
-        )
+        if os.path.exists(filepath):
+            old_content = read_page_file(filepath)
+            backup_path = os.path.join(BACKUP_DIR, f'{page_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.ejs')
+            with open(backup_path, 'w', encoding='utf-8') as f:
+                f.write(old_content)
+        
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+        st = os.stat(filepath)
+        _PAGE_CACHE[filepath] = (st.st_mtime_ns, st.st_size, content)
         
-        new_content = response.choices[0].message.content
+        return {'success': True, 'message': 'Page saved successfully'}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+def stream_rewrite(client, prompt):
+    stream = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": LEGAL_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=4000,
+        temperature=0.3,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def ai_rewrite_page(page_name, current_content, action='rewrite'):
+    page_name = _SLUG_MAP.get(page_name, page_name)
+    
+    client = get_openai_client()
+    
+    if not client:
+        return {'success': False, 'error': 'OpenAI client not available'}
+    
+    cache_key = (page_name, action, hashlib.sha1(current_content.encode('utf-8')).hexdigest())
+    if cache_key in _REWRITE_CACHE:
+        _REWRITE_CACHE.move_to_end(cache_key)
+        new_content = _REWRITE_CACHE[cache_key]
+        log_ai_action(page_name, action, len(current_content), len(new_content))
+        return {'success': True, 'content': new_content}
+    
+    head, middle, tail = _PROMPT_PARTS.get(action, _PROMPT_PARTS['rewrite'])
+    prompt = ''.join((head, _PAGE_DESCRIPTIONS.get(page_name, 'legal page'), middle, current_content, tail))
+    
+    try:
+        new_content = ''.join(stream_rewrite(client, prompt))
         
         log_ai_action(page_name, action, len(current_content), len(new_content))
         
+        # An empty answer is a failed rewrite; ask the model again next time
+        if new_content:
+            _REWRITE_CACHE[cache_key] = new_content
+            if len(_REWRITE_CACHE) > REWRITE_CACHE_SIZE:
+                _REWRITE_CACHE.popitem(last=False)
+        
         return {'success': True, 'content': new_content}
         
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def dumps_line(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data) + '\n').encode('utf-8')
+
+def iter_ai_logs():
+    # Actions logged before the switch to JSON Lines live in the old JSON file
+    if os.path.exists(LEGACY_AI_LOG_FILE):
+        with open(LEGACY_AI_LOG_FILE, 'r') as f:
+            yield from json.load(f).get('actions', [])
+    if os.path.exists(AI_LOG_FILE):
+        with open(AI_LOG_FILE, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def compact_ai_logs():
+    actions = deque(iter_ai_logs(), maxlen=AI_LOG_LIMIT)
+    tmp_file = AI_LOG_FILE + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.writelines(dumps_line(action) for action in actions)
+    os.replace(tmp_file, AI_LOG_FILE)
+    if os.path.exists(LEGACY_AI_LOG_FILE):
+        os.remove(LEGACY_AI_LOG_FILE)
+
 def log_ai_action(page_name, action, old_length, new_length):
-    log_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'legal_ai_logs.json')
-    
     try:
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        else:
-            logs = {'actions': []}
-        
-        logs['actions'].append({
+        entry = {
             'page': page_name,
             'action': action,
             'timestamp': datetime.now().isoformat(),
             'old_length': old_length,
             'new_length': new_length
-        })
+        }
         
-        logs['actions'] = logs['actions'][-100:]
+        with open(AI_LOG_FILE, 'ab') as f:
+            f.write(dumps_line(entry))
+            size = f.tell()
         
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
+        if size > AI_LOG_COMPACT_BYTES:
+            compact_ai_logs()
     except:
         pass
 
 def get_ai_logs():
-    log_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'legal_ai_logs.json')
-    
     try:
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                return json.load(f)
-        return {'actions': []}
+        return {'actions': list(deque(iter_ai_logs(), maxlen=AI_LOG_LIMIT))}
     except:
         return {'actions': []}
@@ -6,15 +6,25 @@ Points-based rewards program for repeat customers
 
 import os
 import json
+import bisect
+import heapq
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from collections import Counter
+
+try:
+    from .json_io import json_dumps, json_dumps_line, write_file_atomic
+except ImportError:
+    from json_io import json_dumps, json_dumps_line, write_file_atomic
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 LOYALTY_FILE = DATA_DIR / "loyalty_accounts.json"
 REWARDS_FILE = DATA_DIR / "rewards_catalog.json"
-TRANSACTIONS_FILE = DATA_DIR / "loyalty_transactions.json"
+TRANSACTIONS_FILE = DATA_DIR / "loyalty_transactions.jsonl"
+LEGACY_TRANSACTIONS_FILE = DATA_DIR / "loyalty_transactions.json"
+TAIL_BLOCK_SIZE = 64 * 1024
 
 # Loyalty tiers
 TIERS = {
@@ -24,6 +34,11 @@ TIERS = {
     "platinum": {"min_points": 5000, "multiplier": 2.0, "perks": ["VIP everything", "Personal shopper", "Monthly gift"]}
 }
 
+# Tier thresholds in ascending order, for bisecting a points total to its tier
+_TIER_THRESHOLDS = sorted((config["min_points"], tier) for tier, config in TIERS.items())
+_TIER_POINTS = [min_points for min_points, _ in _TIER_THRESHOLDS]
+_TIER_NAMES = [tier for _, tier in _TIER_THRESHOLDS]
+
 # Points earning rules
 POINTS_RULES = {
     "purchase": 1,  # Points per dollar spent
@@ -33,18 +48,26 @@ POINTS_RULES = {
     "signup": 100,    # Welcome bonus
 }
 
+# Parsed accounts file, reused until its mtime changes
+_accounts_cache = {"mtime": None, "data": None}
+
 def load_loyalty_accounts() -> Dict:
     """Load all loyalty accounts"""
     if LOYALTY_FILE.exists():
-        with open(LOYALTY_FILE, "r") as f:
-            return json.load(f)
+        mtime = LOYALTY_FILE.stat().st_mtime_ns
+        if _accounts_cache["mtime"] != mtime:
+            with open(LOYALTY_FILE, "rb") as f:
+                _accounts_cache["data"] = json.load(f)
+            _accounts_cache["mtime"] = mtime
+        return _accounts_cache["data"]
     return {"accounts": {}, "settings": {"enabled": True, "points_per_dollar": 1}}
 
 def save_loyalty_accounts(data: Dict):
     """Save loyalty accounts"""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(LOYALTY_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    write_file_atomic(LOYALTY_FILE, json_dumps(data, indent=True))
+    _accounts_cache["data"] = data
+    _accounts_cache["mtime"] = LOYALTY_FILE.stat().st_mtime_ns
 
 def load_rewards_catalog() -> List[Dict]:
     """Load rewards catalog"""
@@ -65,28 +88,57 @@ def load_rewards_catalog() -> List[Dict]:
 
 def save_rewards_catalog(rewards: List[Dict]):
     """Save rewards catalog"""
-    with open(REWARDS_FILE, "w") as f:
-        json.dump(rewards, f, indent=2)
+    write_file_atomic(REWARDS_FILE, json_dumps(rewards, indent=True))
+
+def iter_transactions():
+    """Yield loyalty transactions oldest first"""
+    # Transactions logged before the switch to JSON Lines live in the old JSON list
+    if LEGACY_TRANSACTIONS_FILE.exists():
+        with open(LEGACY_TRANSACTIONS_FILE, "rb") as f:
+            yield from json.load(f)
+    if TRANSACTIONS_FILE.exists():
+        with open(TRANSACTIONS_FILE, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def iter_transactions_reversed():
+    """Yield loyalty transactions newest first, reading the log backwards in blocks"""
+    if TRANSACTIONS_FILE.exists():
+        with open(TRANSACTIONS_FILE, "rb") as f:
+            pos = f.seek(0, os.SEEK_END)
+            partial = b""
+            while pos > 0:
+                step = min(TAIL_BLOCK_SIZE, pos)
+                pos -= step
+                f.seek(pos)
+                lines = (f.read(step) + partial).split(b"\n")
+                # The first piece may be the end of a line that started in an earlier block
+                partial = lines[0]
+                for line in reversed(lines[1:]):
+                    if line.strip():
+                        yield json.loads(line)
+            if partial.strip():
+                yield json.loads(partial)
+    if LEGACY_TRANSACTIONS_FILE.exists():
+        with open(LEGACY_TRANSACTIONS_FILE, "rb") as f:
+            yield from reversed(json.load(f))
 
 def load_transactions() -> List[Dict]:
     """Load loyalty transactions"""
-    if TRANSACTIONS_FILE.exists():
-        with open(TRANSACTIONS_FILE, "r") as f:
-            return json.load(f)
-    return []
+    return list(iter_transactions())
 
 def save_transactions(transactions: List[Dict]):
-    """Save loyalty transactions"""
-    with open(TRANSACTIONS_FILE, "w") as f:
-        json.dump(transactions, f, indent=2)
+    """Save loyalty transactions, replacing any existing log"""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    write_file_atomic(TRANSACTIONS_FILE, b"".join(json_dumps_line(transaction) for transaction in transactions))
+    if LEGACY_TRANSACTIONS_FILE.exists():
+        LEGACY_TRANSACTIONS_FILE.unlink()
 
 def get_tier(points: int) -> str:
     """Determine tier based on lifetime points"""
-    current_tier = "bronze"
-    for tier, config in TIERS.items():
-        if points >= config["min_points"]:
-            current_tier = tier
-    return current_tier
+    idx = bisect.bisect_right(_TIER_POINTS, points) - 1
+    return _TIER_NAMES[idx] if idx >= 0 else "bronze"
 
 def get_tier_info(tier: str) -> Dict:
     """Get tier information"""
@@ -127,6 +179,8 @@ def get_account(user_id: str) -> Optional[Dict]:
     account = data["accounts"].get(user_id)
     
     if account:
+        # Decorate a copy so the cached account is saved back without these fields
+        account = dict(account)
         # Update tier based on lifetime points
         account["tier"] = get_tier(account.get("lifetime_points", 0))
         account["tier_info"] = get_tier_info(account["tier"])
@@ -234,8 +288,6 @@ def redeem_reward(user_id: str, reward_id: str) -> Dict:
 
 def log_transaction(user_id: str, type: str, points: int, reason: str, details: str = "", order_id: str = None):
     """Log a loyalty transaction"""
-    transactions = load_transactions()
-    
     transaction = {
         "id": f"tx_{int(datetime.now().timestamp())}_{user_id[:6]}",
         "user_id": user_id,
@@ -247,14 +299,42 @@ def log_transaction(user_id: str, type: str, points: int, reason: str, details:
         "created_at": datetime.now().isoformat()
     }
     
-    transactions.append(transaction)
-    save_transactions(transactions)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    with open(TRANSACTIONS_FILE, "ab") as f:
+        f.write(json_dumps_line(transaction))
 
 def get_transactions(user_id: str, limit: int = 20) -> List[Dict]:
     """Get user's transaction history"""
-    transactions = load_transactions()
-    user_tx = [t for t in transactions if t.get("user_id") == user_id]
-    return sorted(user_tx, key=lambda x: x["created_at"], reverse=True)[:limit]
+    if limit <= 0:
+        user_tx = [t for t in iter_transactions() if t.get("user_id") == user_id]
+        return sorted(user_tx, key=lambda x: x["created_at"], reverse=True)[:limit]
+    
+    # The log is appended in time order, so the newest entries are at the end
+    user_tx = []
+    for t in iter_transactions_reversed():
+        if t.get("user_id") == user_id:
+            user_tx.append(t)
+            if len(user_tx) == limit:
+                break
+    user_tx.reverse()
+    return sorted(user_tx, key=lambda x: x["created_at"], reverse=True)
+
+# referral_code -> user ids holding it (account order), rebuilt when the accounts data or file changes
+_referral_index = {"data": None, "mtime": None, "index": None}
+
+def get_referral_index(data: Dict) -> Dict[str, List[str]]:
+    """Map referral code -> user ids with that code, in account order"""
+    mtime = _accounts_cache["mtime"]
+    if _referral_index["data"] is not data or _referral_index["mtime"] != mtime:
+        index = {}
+        for uid, acc in data["accounts"].items():
+            code = acc.get("referral_code")
+            if code is not None:
+                index.setdefault(code, []).append(uid)
+        _referral_index["index"] = index
+        _referral_index["data"] = data
+        _referral_index["mtime"] = mtime
+    return _referral_index["index"]
 
 def apply_referral(user_id: str, referral_code: str) -> Dict:
     """Apply a referral code"""
@@ -269,9 +349,9 @@ def apply_referral(user_id: str, referral_code: str) -> Dict:
     
     # Find referrer
     referrer = None
-    for uid, acc in data["accounts"].items():
-        if acc.get("referral_code") == referral_code and uid != user_id:
-            referrer = acc
+    for uid in get_referral_index(data).get(referral_code, ()):
+        if uid != user_id:
+            referrer = data["accounts"][uid]
             referrer_id = uid
             break
     
@@ -299,31 +379,47 @@ def apply_referral(user_id: str, referral_code: str) -> Dict:
         "new_balance": account["points"]
     }
 
+def short_name(name: str, width: int = 15) -> str:
+    """Truncate a member name for public display"""
+    return name[:width] + "..." if len(name) > width else name
+
 def get_leaderboard(limit: int = 10) -> List[Dict]:
     """Get top loyalty members"""
     data = load_loyalty_accounts()
-    accounts = list(data["accounts"].values())
-    
-    leaderboard = sorted(accounts, key=lambda x: x.get("lifetime_points", 0), reverse=True)[:limit]
-    
-    return [{
-        "name": a.get("name", "Member")[:15] + "..." if len(a.get("name", "")) > 15 else a.get("name", "Member"),
-        "tier": get_tier(a.get("lifetime_points", 0)),
-        "lifetime_points": a.get("lifetime_points", 0)
-    } for a in leaderboard]
+    accounts = data["accounts"].values()
+    by_points = lambda x: x.get("lifetime_points", 0)
+    
+    if limit >= 0:
+        leaderboard = heapq.nlargest(limit, accounts, key=by_points)
+    else:
+        leaderboard = sorted(accounts, key=by_points, reverse=True)[:limit]
+    
+    result = []
+    for a in leaderboard:
+        lifetime_points = a.get("lifetime_points", 0)
+        result.append({
+            "name": short_name(a.get("name", "Member")),
+            "tier": get_tier(lifetime_points),
+            "lifetime_points": lifetime_points
+        })
+    return result
 
 def get_program_stats() -> Dict:
     """Get loyalty program statistics"""
     data = load_loyalty_accounts()
-    accounts = list(data["accounts"].values())
-    
-    total_members = len(accounts)
-    total_points_earned = sum(a.get("lifetime_points", 0) for a in accounts)
-    total_points_available = sum(a.get("points", 0) for a in accounts)
     
-    tier_distribution = {}
-    for tier in TIERS.keys():
-        tier_distribution[tier] = sum(1 for a in accounts if get_tier(a.get("lifetime_points", 0)) == tier)
+    total_members = 0
+    total_points_earned = 0
+    total_points_available = 0
+    tier_counts = Counter()
+    for a in data["accounts"].values():
+        lifetime_points = a.get("lifetime_points", 0)
+        total_members += 1
+        total_points_earned += lifetime_points
+        total_points_available += a.get("points", 0)
+        tier_counts[get_tier(lifetime_points)] += 1
+    
+    tier_distribution = {tier: tier_counts[tier] for tier in TIERS}
     
     return {
         "total_members": total_members,
@@ -5,19 +5,47 @@ Tracks customer loyalty: points, levels, rewards, engagement
 
 import json
 import os
+import sys
+import bisect
 from datetime import datetime
 from pathlib import Path
 
+try:
+    from ..json_io import json_loads, json_dumps, write_file_atomic
+except ImportError:
+    # Run as a script from its own directory: the shared helpers live one level up
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from json_io import json_loads, json_dumps, write_file_atomic
+
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
 LOYALTY_FILE = DATA_DIR / "loyalty_accounts.json"
 RULES_FILE = Path(__file__).parent / "loyalty_rules.json"
 
+# Parsed rules, reloaded only when loyalty_rules.json changes on disk
+_rules_cache = {"mtime": None, "data": None}
+
 def load_rules():
     if RULES_FILE.exists():
-        with open(RULES_FILE, 'r') as f:
-            return json.load(f)
+        mtime = RULES_FILE.stat().st_mtime_ns
+        if _rules_cache["mtime"] != mtime:
+            with open(RULES_FILE, 'rb') as f:
+                _rules_cache["data"] = json_loads(f.read())
+            _rules_cache["mtime"] = mtime
+        return _rules_cache["data"]
     return get_default_rules()
 
+# Rewards keyed by id, rebuilt whenever a different rules dict is loaded
+_rewards_index = {"data": None, "index": None}
+
+def get_reward(rules, reward_id):
+    if _rewards_index["data"] is not rules:
+        index = {}
+        for r in rules.get("rewards", []):
+            index.setdefault(r["id"], r)
+        _rewards_index["index"] = index
+        _rewards_index["data"] = rules
+    return _rewards_index["index"].get(reward_id)
+
 def get_default_rules():
     return {
         "points_per_dollar": 10,
@@ -43,39 +71,73 @@ def get_default_rules():
         }
     }
 
+# Parsed accounts shared by every call until the file changes on disk.
+# Functions hand out copies when they add derived fields (level, benefits),
+# so those never leak into the cached data and get saved.
+_accounts_cache = {"mtime": None, "data": None}
+
 def load_accounts():
     if LOYALTY_FILE.exists():
-        with open(LOYALTY_FILE, 'r') as f:
-            return json.load(f)
+        mtime = LOYALTY_FILE.stat().st_mtime_ns
+        if _accounts_cache["mtime"] != mtime:
+            with open(LOYALTY_FILE, 'rb') as f:
+                _accounts_cache["data"] = json_loads(f.read())
+            _accounts_cache["mtime"] = mtime
+        return _accounts_cache["data"]
     return {"accounts": []}
 
 def save_accounts(data):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(LOYALTY_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    write_file_atomic(LOYALTY_FILE, json_dumps(data, indent=True))
+    _accounts_cache["data"] = data
+    _accounts_cache["mtime"] = LOYALTY_FILE.stat().st_mtime_ns
+
+# Levels sorted by min_points, with their thresholds and positions, rebuilt whenever a different rules dict is loaded
+_levels_index = {"data": None, "levels": (), "thresholds": [], "position": {}}
+
+def get_sorted_levels(rules):
+    if _levels_index["data"] is not rules:
+        levels = tuple(sorted(rules.get("levels", {}).items(), key=lambda x: x[1]["min_points"]))
+        _levels_index["levels"] = levels
+        _levels_index["thresholds"] = [level_data["min_points"] for _, level_data in levels]
+        _levels_index["position"] = {level_name: i for i, (level_name, _) in enumerate(levels)}
+        _levels_index["data"] = rules
+    return _levels_index
 
 def get_level(points):
-    rules = load_rules()
-    levels = rules.get("levels", {})
-    current_level = "Bronze"
-    for level_name, level_data in sorted(levels.items(), key=lambda x: x[1]["min_points"]):
-        if points >= level_data["min_points"]:
-            current_level = level_name
-    return current_level
+    levels = get_sorted_levels(load_rules())
+    # Last level whose min_points is <= points; equal thresholds resolve to the later level, as before
+    idx = bisect.bisect_right(levels["thresholds"], points) - 1
+    return levels["levels"][idx][0] if idx >= 0 else "Bronze"
 
 def get_level_benefits(level_name):
     rules = load_rules()
     levels = rules.get("levels", {})
     return levels.get(level_name, levels.get("Bronze", {}))
 
+# Accounts keyed by str(user_id), rebuilt whenever a different accounts dict is loaded.
+# Values are the account dicts inside data["accounts"], so mutations reach the saved list.
+_account_index = {"data": None, "index": None}
+
+def get_account_index(data):
+    if _account_index["data"] is not data:
+        index = {}
+        for acc in data.get("accounts", []):
+            index.setdefault(str(acc.get("user_id")), acc)
+        _account_index["index"] = index
+        _account_index["data"] = data
+    return _account_index["index"]
+
 def get_account(user_id):
     data = load_accounts()
-    for acc in data.get("accounts", []):
-        if str(acc.get("user_id")) == str(user_id):
-            acc["level"] = get_level(acc.get("points", 0))
-            acc["benefits"] = get_level_benefits(acc["level"])
-            return acc
-    return None
+    acc = get_account_index(data).get(str(user_id))
+    if acc is None:
+        return None
+    
+    account = dict(acc)
+    account["level"] = get_level(account.get("points", 0))
+    account["benefits"] = get_level_benefits(account["level"])
+    return account
 
 def create_account(user_id, email=None, name=None):
     data = load_accounts()
@@ -99,111 +161,107 @@ def create_account(user_id, email=None, name=None):
         "redeemed_rewards": []
     }
     data["accounts"].append(new_account)
+    get_account_index(data)[new_account["user_id"]] = new_account
     save_accounts(data)
+    new_account = dict(new_account)
     new_account["benefits"] = get_level_benefits("Bronze")
     return new_account
 
 def earn_points(user_id, points, reason, order_amount=0):
     data = load_accounts()
-    for acc in data.get("accounts", []):
-        if str(acc.get("user_id")) == str(user_id):
-            acc["points"] = acc.get("points", 0) + points
-            acc["lifetime_points"] = acc.get("lifetime_points", 0) + points
-            if order_amount > 0:
-                acc["total_spent"] = acc.get("total_spent", 0) + order_amount
-                acc["order_count"] = acc.get("order_count", 0) + 1
-            
-            transaction = {
-                "type": "earn",
-                "points": points,
-                "reason": reason,
-                "order_amount": order_amount,
-                "timestamp": datetime.now().isoformat()
-            }
-            if "transactions" not in acc:
-                acc["transactions"] = []
-            acc["transactions"].append(transaction)
-            
-            acc["level"] = get_level(acc["points"])
-            save_accounts(data)
-            return acc
-    return None
+    acc = get_account_index(data).get(str(user_id))
+    if acc is None:
+        return None
+    
+    acc["points"] = acc.get("points", 0) + points
+    acc["lifetime_points"] = acc.get("lifetime_points", 0) + points
+    if order_amount > 0:
+        acc["total_spent"] = acc.get("total_spent", 0) + order_amount
+        acc["order_count"] = acc.get("order_count", 0) + 1
+    
+    transaction = {
+        "type": "earn",
+        "points": points,
+        "reason": reason,
+        "order_amount": order_amount,
+        "timestamp": datetime.now().isoformat()
+    }
+    if "transactions" not in acc:
+        acc["transactions"] = []
+    acc["transactions"].append(transaction)
+    
+    acc["level"] = get_level(acc["points"])
+    save_accounts(data)
+    return dict(acc)
 
 def redeem_reward(user_id, reward_id):
-    rules = load_rules()
-    rewards = rules.get("rewards", [])
-    
-    reward = None
-    for r in rewards:
-        if r["id"] == reward_id:
-            reward = r
-            break
+    reward = get_reward(load_rules(), reward_id)
     
     if not reward:
         return {"success": False, "error": "Reward not found"}
     
     data = load_accounts()
-    for acc in data.get("accounts", []):
-        if str(acc.get("user_id")) == str(user_id):
-            if acc.get("points", 0) < reward["points_cost"]:
-                return {"success": False, "error": "Not enough points"}
-            
-            acc["points"] -= reward["points_cost"]
-            
-            redemption = {
-                "reward_id": reward_id,
-                "reward_name": reward["name"],
-                "points_spent": reward["points_cost"],
-                "reward_type": reward["type"],
-                "reward_value": reward.get("value"),
-                "timestamp": datetime.now().isoformat(),
-                "code": f"PAWSY-{reward_id.upper()}-{user_id[-4:] if len(str(user_id)) >= 4 else user_id}"
-            }
-            
-            if "redeemed_rewards" not in acc:
-                acc["redeemed_rewards"] = []
-            acc["redeemed_rewards"].append(redemption)
-            
-            transaction = {
-                "type": "redeem",
-                "points": -reward["points_cost"],
-                "reason": f"Redeemed: {reward['name']}",
-                "timestamp": datetime.now().isoformat()
-            }
-            if "transactions" not in acc:
-                acc["transactions"] = []
-            acc["transactions"].append(transaction)
-            
-            save_accounts(data)
-            return {"success": True, "redemption": redemption, "remaining_points": acc["points"]}
-    
-    return {"success": False, "error": "Account not found"}
+    acc = get_account_index(data).get(str(user_id))
+    if acc is None:
+        return {"success": False, "error": "Account not found"}
+    
+    if acc.get("points", 0) < reward["points_cost"]:
+        return {"success": False, "error": "Not enough points"}
+    
+    acc["points"] -= reward["points_cost"]
+    # One timestamp for the redemption and its transaction
+    now = datetime.now().isoformat()
+    
+    redemption = {
+        "reward_id": reward_id,
+        "reward_name": reward["name"],
+        "points_spent": reward["points_cost"],
+        "reward_type": reward["type"],
+        "reward_value": reward.get("value"),
+        "timestamp": now,
+        "code": f"PAWSY-{reward_id.upper()}-{user_id[-4:] if len(str(user_id)) >= 4 else user_id}"
+    }
+    
+    if "redeemed_rewards" not in acc:
+        acc["redeemed_rewards"] = []
+    acc["redeemed_rewards"].append(redemption)
+    
+    transaction = {
+        "type": "redeem",
+        "points": -reward["points_cost"],
+        "reason": f"Redeemed: {reward['name']}",
+        "timestamp": now
+    }
+    if "transactions" not in acc:
+        acc["transactions"] = []
+    acc["transactions"].append(transaction)
+    
+    save_accounts(data)
+    return {"success": True, "redemption": dict(redemption), "remaining_points": acc["points"]}
 
 def get_available_rewards(user_id):
     rules = load_rules()
-    account = get_account(user_id)
+    # Only the balance is needed, so skip get_account's copy and level/benefits lookups
+    acc = get_account_index(load_accounts()).get(str(user_id))
     
-    if not account:
+    if acc is None:
         return []
     
-    current_points = account.get("points", 0)
-    rewards = []
-    
-    for reward in rules.get("rewards", []):
-        rewards.append({
-            **reward,
-            "affordable": current_points >= reward["points_cost"],
-            "points_needed": max(0, reward["points_cost"] - current_points)
-        })
+    current_points = acc.get("points", 0)
     
-    return rewards
+    return [{
+        **reward,
+        "affordable": current_points >= reward["points_cost"],
+        "points_needed": max(0, reward["points_cost"] - current_points)
+    } for reward in rules.get("rewards", [])]
 
 def get_all_accounts():
     data = load_accounts()
     accounts = []
     for acc in data.get("accounts", []):
-        acc["level"] = get_level(acc.get("points", 0))
-        accounts.append(acc)
+        account = dict(acc)
+        account["level"] = get_level(account.get("points", 0))
+        accounts.append(account)
     return accounts
 
 def calculate_points_from_order(order_total):
@@ -216,25 +274,23 @@ def get_next_level_info(user_id):
     if not account:
         return None
     
-    rules = load_rules()
-    current_level = account["level"]
+    levels = get_sorted_levels(load_rules())
     current_points = account.get("points", 0)
     
-    levels_sorted = sorted(rules["levels"].items(), key=lambda x: x[1]["min_points"])
-    
-    for i, (level_name, level_data) in enumerate(levels_sorted):
-        if level_name == current_level:
-            if i + 1 < len(levels_sorted):
-                next_level_name, next_level_data = levels_sorted[i + 1]
-                points_needed = next_level_data["min_points"] - current_points
-                return {
-                    "next_level": next_level_name,
-                    "points_needed": max(0, points_needed),
-                    "next_level_benefits": next_level_data
-                }
-            return {"next_level": None, "message": "You've reached the highest level!"}
-    
-    return None
+    i = levels["position"].get(account["level"])
+    if i is None:
+        return None
+    
+    levels_sorted = levels["levels"]
+    if i + 1 < len(levels_sorted):
+        next_level_name, next_level_data = levels_sorted[i + 1]
+        points_needed = next_level_data["min_points"] - current_points
+        return {
+            "next_level": next_level_name,
+            "points_needed": max(0, points_needed),
+            "next_level_benefits": next_level_data
+        }
+    return {"next_level": None, "message": "You've reached the highest level!"}
 
 if __name__ == "__main__":
     print("Loyalty Engine V1 - GetPawsy ULTRA V5.6")
@@ -3,6 +3,8 @@
 Patch Engine - Auto-patches HTML and CSS files
 """
 import os
+import atexit
+import mmap
 import re
 from datetime import datetime
 
@@ -13,99 +15,139 @@ HTML_FILES = ["views/index.ejs", "views/product.ejs", "views/collections.ejs"]
 def ensure_log_dir():
     os.makedirs("logs", exist_ok=True)
 
+_LOG_FP = None
+
 def log(message):
-    ensure_log_dir()
+    global _LOG_FP
+    if _LOG_FP is None:
+        ensure_log_dir()
+        _LOG_FP = open(LOG_FILE, "a", buffering=64 * 1024)
+        atexit.register(_LOG_FP.close)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}\n"
-    with open(LOG_FILE, "a") as f:
-        f.write(log_entry)
+    _LOG_FP.write(log_entry)
     print(log_entry.strip())
 
+HERO_IMG_SELECTOR = ".hero-section img {"
+HERO_CONTENT_SELECTOR = ".hero-content {"
+HERO_SECTION_RE = re.compile(r"\.hero-section\s*\{[^}]*")
+
+MOBILE_HERO = """
+@media (max-width: 768px) {
+  .hero-section {
+    min-height: 400px;
+  }
+  .hero-content h1 {
+    font-size: 1.8rem;
+  }
+  .hero-content p {
+    font-size: 1rem;
+  }
+}
+"""
+
+# Each patch only plans insertions as (offset, order, text) against the original CSS.
+# None of the inserted snippets contain a selector, brace or flag another patch looks
+# for, so planning every patch on the unmodified text gives the same result as
+# applying them one after another. At a shared offset, lower order goes first.
+
+def find_all(text, needle):
+    start = text.find(needle)
+    while start != -1:
+        yield start
+        start = text.find(needle, start + len(needle))
+
 def patch_hero_ratio(css_content):
+    insertions = []
     patches_applied = 0
     
     if "object-fit: cover" not in css_content:
-        css_content = css_content.replace(
-            ".hero-section img {",
-            ".hero-section img {\n  object-fit: cover;"
-        )
+        for start in find_all(css_content, HERO_IMG_SELECTOR):
+            insertions.append((start + len(HERO_IMG_SELECTOR), 0, "\n  object-fit: cover;"))
         patches_applied += 1
         log("Patched: Added object-fit: cover to hero images")
     
     if "aspect-ratio" not in css_content:
-        hero_pattern = r"(\.hero-section\s*\{[^}]*)"
-        if re.search(hero_pattern, css_content):
-            css_content = re.sub(
-                hero_pattern,
-                r"\1\n  aspect-ratio: 16/9;",
-                css_content
-            )
+        ends = [m.end() for m in HERO_SECTION_RE.finditer(css_content)]
+        if ends:
+            # The block match runs up to the closing brace, so this lands after anything inserted inside it
+            insertions.extend((end, 1, "\n  aspect-ratio: 16/9;") for end in ends)
             patches_applied += 1
             log("Patched: Added aspect-ratio to hero section")
     
-    return css_content, patches_applied
+    return insertions, patches_applied
 
 def patch_text_overlay(css_content):
+    insertions = []
     patches_applied = 0
     
     if ".hero-content" in css_content:
         if "text-align: center" not in css_content:
-            css_content = css_content.replace(
-                ".hero-content {",
-                ".hero-content {\n  text-align: center;"
-            )
+            for start in find_all(css_content, HERO_CONTENT_SELECTOR):
+                insertions.append((start + len(HERO_CONTENT_SELECTOR), 0, "\n  text-align: center;"))
             patches_applied += 1
             log("Patched: Centered hero text overlay")
     
-    return css_content, patches_applied
+    return insertions, patches_applied
 
 def patch_responsive_fixes(css_content):
+    insertions = []
     patches_applied = 0
     
-    mobile_hero = """
-@media (max-width: 768px) {
-  .hero-section {
-    min-height: 400px;
-  }
-  .hero-content h1 {
-    font-size: 1.8rem;
-  }
-  .hero-content p {
-    font-size: 1rem;
-  }
-}
-"""
-    
     if "@media (max-width: 768px)" not in css_content or ".hero-section" not in css_content:
-        css_content += "\n" + mobile_hero
+        insertions.append((len(css_content), 2, "\n" + MOBILE_HERO))
         patches_applied += 1
         log("Patched: Added mobile responsive hero styles")
     
-    return css_content, patches_applied
+    return insertions, patches_applied
+
+def apply_insertions(text, insertions):
+    parts = []
+    last = 0
+    for offset, _, snippet in sorted(insertions, key=lambda ins: (ins[0], ins[1])):
+        parts.append(text[last:offset])
+        parts.append(snippet)
+        last = offset
+    parts.append(text[last:])
+    return "".join(parts)
+
+# With all of these present, none of the CSS patches applies (text overlay also needs .hero-content)
+PATCHED_MARKERS = (b"object-fit: cover", b"aspect-ratio", b"text-align: center", b"@media (max-width: 768px)", b".hero-section")
+
+def css_already_patched(path):
+    # Search the mapped file, so the usual no-op run never reads it into a Python string
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file: cannot be mapped, and has none of the markers anyway
+            return False
+        with mm:
+            return all(mm.find(marker) != -1 for marker in PATCHED_MARKERS)
 
 def patch_css():
     if not os.path.exists(CSS_FILE):
         log(f"CSS file not found: {CSS_FILE}")
         return 0
     
+    if css_already_patched(CSS_FILE):
+        log("No CSS patches needed")
+        return 0
+    
     with open(CSS_FILE, "r") as f:
         content = f.read()
     
-    original_content = content
+    insertions = []
     total_patches = 0
     
-    content, patches = patch_hero_ratio(content)
-    total_patches += patches
-    
-    content, patches = patch_text_overlay(content)
-    total_patches += patches
-    
-    content, patches = patch_responsive_fixes(content)
-    total_patches += patches
+    for patch in (patch_hero_ratio, patch_text_overlay, patch_responsive_fixes):
+        found, patches = patch(content)
+        insertions.extend(found)
+        total_patches += patches
     
-    if content != original_content:
+    if insertions:
         with open(CSS_FILE, "w") as f:
-            f.write(content)
+            f.write(apply_insertions(content, insertions))
         log(f"CSS file updated with {total_patches} patches")
     else:
         log("No CSS patches needed")
@@ -134,6 +176,7 @@ def run_patches():
     
     total = css_patches + html_patches
     log(f"=== Patch Engine Complete: {total} patches applied ===")
+    _LOG_FP.flush()
     
     return {
         "css_patches": css_patches,
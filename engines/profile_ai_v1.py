@@ -5,8 +5,16 @@ Builds AI-powered customer profiles from behavior, purchases, chat history, and
 
 import json
 import os
+import re
+import bisect
 from datetime import datetime, timedelta
 from pathlib import Path
+from collections import Counter
+
+try:
+    from .json_io import json_loads, json_dumps, write_file_atomic
+except ImportError:
+    from json_io import json_loads, json_dumps, write_file_atomic
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 PROFILES_FILE = DATA_DIR / "customer_profiles.json"
@@ -18,29 +26,74 @@ BUDGET_LEVELS = {
     "luxury": {"max_avg_order": float('inf'), "label": "Luxury Shopper"}
 }
 
+# Budget levels in ascending max_avg_order, for bisecting an average order value
+_BUDGET_SORTED = sorted(BUDGET_LEVELS.items(), key=lambda x: x[1]["max_avg_order"])
+_BUDGET_THRESHOLDS = [config["max_avg_order"] for _, config in _BUDGET_SORTED]
+_BUDGET_NAMES = [level for level, _ in _BUDGET_SORTED]
+
 INTEREST_CATEGORIES = [
     "toys", "food", "treats", "beds", "clothing", "grooming", 
     "health", "accessories", "outdoor", "training"
 ]
 
+CHAT_TOPICS = ["toy", "food", "bed", "treat", "health", "training"]
+
+# Pet words count only as whole words, so "category" or "location" is not a cat mention
+PET_OF_WORD = {
+    "dog": "dog", "dogs": "dog", "doggy": "dog", "doggie": "dog", "doggies": "dog",
+    "puppy": "dog", "puppies": "dog",
+    "cat": "cat", "cats": "cat", "catnip": "cat", "kitten": "cat", "kittens": "cat"
+}
+
+# Topics and pet words in one scan of a message. Topics are a zero-width lookahead, so they
+# still match inside longer words ("toys", "treats", "healthy") like the old `in` tests;
+# pet words are whole words. No topic starts with the same letter as a pet word, and no pet
+# word contains a topic, so the two alternatives never hide each other.
+CHAT_TERMS_RE = re.compile(
+    r"(?=(toy|food|bed|treat|health|training))"
+    r"|\b(dogs?|dogg(?:y|ie|ies)|pupp(?:y|ies)|cats?|catnip|kittens?)\b"
+)
+
 def load_profiles():
     if PROFILES_FILE.exists():
-        with open(PROFILES_FILE, 'r') as f:
-            return json.load(f)
+        with open(PROFILES_FILE, 'rb') as f:
+            return json_loads(f.read())
     return {"profiles": []}
 
 def save_profiles(data):
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(PROFILES_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    write_file_atomic(PROFILES_FILE, json_dumps(data, indent=True))
+
+# Parsed data files keyed by filename, each reused until the file's mtime changes.
+# Every analyze_* call reads one of these, so a batch of profiles parses each file once.
+_json_cache = {}
 
 def load_json_file(filename):
     filepath = DATA_DIR / filename
     if filepath.exists():
-        with open(filepath, 'r') as f:
-            return json.load(f)
+        mtime = filepath.stat().st_mtime_ns
+        cached = _json_cache.get(filename)
+        if cached is None or cached["mtime"] != mtime:
+            with open(filepath, 'rb') as f:
+                cached = {"mtime": mtime, "data": json_loads(f.read())}
+            _json_cache[filename] = cached
+        return cached["data"]
     return {}
 
+# Records of a data file grouped by str(user_id), rebuilt whenever load_json_file returns a new parse
+_bucket_cache = {}
+
+def load_json_bucketed(filename, list_key):
+    data = load_json_file(filename)
+    cached = _bucket_cache.get((filename, list_key))
+    if cached is None or cached["data"] is not data:
+        buckets = {}
+        for record in data.get(list_key, []):
+            buckets.setdefault(str(record.get("user_id")), []).append(record)
+        cached = {"data": data, "buckets": buckets}
+        _bucket_cache[(filename, list_key)] = cached
+    return cached["buckets"]
+
 def get_profile(user_id):
     data = load_profiles()
     for profile in data.get("profiles", []):
@@ -54,15 +107,11 @@ def analyze_browsing_behavior(user_id):
         user_behavior = behavior_data.get(str(user_id), {})
         
         viewed_products = user_behavior.get("viewed_products", [])
-        categories_viewed = {}
-        
-        for view in viewed_products:
-            cat = view.get("category", "general")
-            categories_viewed[cat] = categories_viewed.get(cat, 0) + 1
+        categories_viewed = Counter(view.get("category", "general") for view in viewed_products)
         
         return {
             "total_views": len(viewed_products),
-            "categories": categories_viewed,
+            "categories": dict(categories_viewed),
             "avg_time_on_site": user_behavior.get("avg_session_time", 0),
             "pages_per_session": user_behavior.get("pages_per_session", 0)
         }
@@ -71,8 +120,7 @@ def analyze_browsing_behavior(user_id):
 
 def analyze_cart_activity(user_id):
     try:
-        carts_data = load_json_file("abandoned_carts.json")
-        user_carts = [c for c in carts_data.get("carts", []) if str(c.get("user_id")) == str(user_id)]
+        user_carts = load_json_bucketed("abandoned_carts.json", "carts").get(str(user_id), [])
         
         abandoned_count = sum(1 for c in user_carts if c.get("status") == "abandoned")
         converted_count = sum(1 for c in user_carts if c.get("status") == "converted")
@@ -88,29 +136,31 @@ def analyze_cart_activity(user_id):
 
 def analyze_purchase_history(user_id):
     try:
-        orders_data = load_json_file("orders.json")
-        user_orders = [o for o in orders_data.get("orders", []) if str(o.get("user_id")) == str(user_id)]
+        user_orders = load_json_bucketed("orders.json", "orders").get(str(user_id), [])
         
         if not user_orders:
             return {"total_orders": 0, "total_spent": 0, "avg_order_value": 0, "favorite_categories": []}
         
-        total_spent = sum(o.get("total", 0) for o in user_orders)
-        avg_order = total_spent / len(user_orders)
-        
-        category_counts = {}
+        # One pass for the total, category counts and latest order date
+        total_spent = 0
+        category_counts = Counter()
+        last_order_date = user_orders[0].get("created_at", "")
         for order in user_orders:
-            for item in order.get("items", []):
-                cat = item.get("category", "general")
-                category_counts[cat] = category_counts.get(cat, 0) + 1
+            total_spent += order.get("total", 0)
+            category_counts.update(item.get("category", "general") for item in order.get("items", []))
+            created_at = order.get("created_at", "")
+            if created_at > last_order_date:
+                last_order_date = created_at
         
-        favorite_cats = sorted(category_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+        avg_order = total_spent / len(user_orders)
         
         return {
             "total_orders": len(user_orders),
             "total_spent": total_spent,
             "avg_order_value": avg_order,
-            "favorite_categories": [c[0] for c in favorite_cats],
-            "last_order_date": max(o.get("created_at", "") for o in user_orders) if user_orders else None
+            "favorite_categories": [cat for cat, _ in category_counts.most_common(3)],
+            # Orders without any created_at give "", which means no known date
+            "last_order_date": last_order_date or None
         }
     except:
         return {"total_orders": 0, "total_spent": 0, "avg_order_value": 0, "favorite_categories": []}
@@ -124,14 +174,19 @@ def analyze_chat_history(user_id):
         topics = {}
         
         for msg in user_chats:
-            text = msg.get("message", "").lower()
-            if "dog" in text or "puppy" in text:
-                pet_mentions["dog"] += 1
-            if "cat" in text or "kitten" in text:
-                pet_mentions["cat"] += 1
+            found_topics = set()
+            found_pets = set()
+            for topic, pet_word in CHAT_TERMS_RE.findall(msg.get("message", "").lower()):
+                if pet_word:
+                    found_pets.add(PET_OF_WORD[pet_word])
+                else:
+                    found_topics.add(topic)
+            
+            for pet in found_pets:
+                pet_mentions[pet] += 1
             
-            for topic in ["toy", "food", "bed", "treat", "health", "training"]:
-                if topic in text:
+            for topic in CHAT_TOPICS:
+                if topic in found_topics:
                     topics[topic] = topics.get(topic, 0) + 1
         
         return {
@@ -144,17 +199,13 @@ def analyze_chat_history(user_id):
 
 def analyze_return_patterns(user_id):
     try:
-        returns_data = load_json_file("returns.json")
-        user_returns = [r for r in returns_data.get("returns", []) if str(r.get("user_id")) == str(user_id)]
+        user_returns = load_json_bucketed("returns.json", "returns").get(str(user_id), [])
         
-        reason_counts = {}
-        for ret in user_returns:
-            reason = ret.get("classified_reason", "other")
-            reason_counts[reason] = reason_counts.get(reason, 0) + 1
+        reason_counts = Counter(ret.get("classified_reason", "other") for ret in user_returns)
         
         return {
             "total_returns": len(user_returns),
-            "return_reasons": reason_counts,
+            "return_reasons": dict(reason_counts),
             "avg_risk_score": sum(r.get("risk_score", 0) for r in user_returns) / len(user_returns) if user_returns else 0
         }
     except:
@@ -181,9 +232,10 @@ def determine_pet_type(browsing, chat, purchases):
         return "both"
 
 def determine_budget_level(avg_order_value):
-    for level, config in sorted(BUDGET_LEVELS.items(), key=lambda x: x[1]["max_avg_order"]):
-        if avg_order_value <= config["max_avg_order"]:
-            return level
+    # First level whose max_avg_order is >= the value
+    idx = bisect.bisect_left(_BUDGET_THRESHOLDS, avg_order_value)
+    if idx < len(_BUDGET_NAMES):
+        return _BUDGET_NAMES[idx]
     return "luxury"
 
 def calculate_purchase_intent(browsing, cart):
@@ -238,7 +290,11 @@ def calculate_churn_risk(purchases, cart, returns):
     else:
         return "low"
 
-def build_profile(user_id, user_email=None, user_name=None):
+def analyze_profile(user_id, user_email=None, user_name=None, now=None):
+    # now: ISO timestamp for created_at/updated_at; a batch passes one for all its profiles
+    if now is None:
+        now = datetime.now().isoformat()
+    
     browsing = analyze_browsing_behavior(user_id)
     cart = analyze_cart_activity(user_id)
     purchases = analyze_purchase_history(user_id)
@@ -273,10 +329,22 @@ def build_profile(user_id, user_email=None, user_name=None):
             "returns": returns
         },
         "recommendations": generate_recommendations(pet_type, interest_categories, budget_level),
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat()
+        "created_at": now,
+        "updated_at": now
     }
     
+    return profile
+
+def store_profile(data, profile, existing_idx):
+    if existing_idx is not None:
+        profile["created_at"] = data["profiles"][existing_idx].get("created_at", profile["created_at"])
+        data["profiles"][existing_idx] = profile
+    else:
+        data["profiles"].append(profile)
+
+def build_profile(user_id, user_email=None, user_name=None):
+    profile = analyze_profile(user_id, user_email, user_name)
+    
     data = load_profiles()
     existing_idx = None
     for i, p in enumerate(data.get("profiles", [])):
@@ -284,15 +352,32 @@ def build_profile(user_id, user_email=None, user_name=None):
             existing_idx = i
             break
     
-    if existing_idx is not None:
-        profile["created_at"] = data["profiles"][existing_idx].get("created_at", profile["created_at"])
-        data["profiles"][existing_idx] = profile
-    else:
-        data["profiles"].append(profile)
-    
+    store_profile(data, profile, existing_idx)
     save_profiles(data)
     return profile
 
+def build_profiles_bulk(user_ids):
+    # One profiles load and one save for the whole batch; the data files are parsed once via load_json_file
+    data = load_profiles()
+    positions = {}
+    for i, p in enumerate(data.get("profiles", [])):
+        positions.setdefault(str(p.get("user_id")), i)
+    
+    now = datetime.now().isoformat()
+    profiles = []
+    for user_id in user_ids:
+        existing_idx = positions.get(str(user_id))
+        # A bulk refresh knows no contact details, so keep the ones already stored
+        existing = data["profiles"][existing_idx] if existing_idx is not None else {}
+        profile = analyze_profile(user_id, existing.get("email"), existing.get("name"), now=now)
+        if existing_idx is None:
+            positions[profile["user_id"]] = len(data["profiles"])
+        store_profile(data, profile, existing_idx)
+        profiles.append(profile)
+    
+    save_profiles(data)
+    return profiles
+
 def generate_recommendations(pet_type, interests, budget):
     recs = []
     
@@ -322,22 +407,19 @@ def get_all_profiles():
 def get_profile_stats():
     profiles = get_all_profiles()
     
+    pet_counts = Counter()
+    churn_counts = Counter()
+    budget_counts = Counter()
+    for p in profiles:
+        pet_counts[p.get("pet_type")] += 1
+        churn_counts[p.get("churn_risk")] += 1
+        budget_counts[p.get("budget_level")] += 1
+    
     return {
         "total_profiles": len(profiles),
-        "pet_types": {
-            "dog": sum(1 for p in profiles if p.get("pet_type") == "dog"),
-            "cat": sum(1 for p in profiles if p.get("pet_type") == "cat"),
-            "both": sum(1 for p in profiles if p.get("pet_type") == "both")
-        },
-        "churn_risk": {
-            "high": sum(1 for p in profiles if p.get("churn_risk") == "high"),
-            "medium": sum(1 for p in profiles if p.get("churn_risk") == "medium"),
-            "low": sum(1 for p in profiles if p.get("churn_risk") == "low")
-        },
-        "budget_levels": {
-            level: sum(1 for p in profiles if p.get("budget_level") == level)
-            for level in BUDGET_LEVELS.keys()
-        }
+        "pet_types": {pet: pet_counts[pet] for pet in ("dog", "cat", "both")},
+        "churn_risk": {risk: churn_counts[risk] for risk in ("high", "medium", "low")},
+        "budget_levels": {level: budget_counts[level] for level in BUDGET_LEVELS}
     }
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@
 Publish Engine - Patches index.html with picture tags and publishes hero
 """
 import os
+import atexit
 import re
 from datetime import datetime
 
@@ -10,25 +11,33 @@ LOG_FILE = "logs/publish.log"
 INDEX_FILE = "views/index.ejs"
 CSS_FILE = "public/css/style.css"
 HERO_DIR = "public/images/hero"
+HERO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
 
 def ensure_log_dir():
     os.makedirs("logs", exist_ok=True)
 
+_LOG_FP = None
+
 def log(message):
-    ensure_log_dir()
+    global _LOG_FP
+    if _LOG_FP is None:
+        ensure_log_dir()
+        _LOG_FP = open(LOG_FILE, "a", buffering=64 * 1024)
+        atexit.register(_LOG_FP.close)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] {message}\n"
-    with open(LOG_FILE, "a") as f:
-        f.write(log_entry)
+    _LOG_FP.write(log_entry)
     print(log_entry.strip())
 
 def get_hero_images():
-    images = []
-    if os.path.exists(HERO_DIR):
-        for file in os.listdir(HERO_DIR):
-            if file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                images.append(file)
-    return sorted(images)
+    if not os.path.exists(HERO_DIR):
+        return []
+    # Suffix test first; is_file() then comes from the directory listing's d_type, not a stat
+    with os.scandir(HERO_DIR) as entries:
+        return sorted(
+            entry.name for entry in entries
+            if entry.name.lower().endswith(HERO_EXTENSIONS) and entry.is_file()
+        )
 
 def generate_picture_tag(images):
     if not images:
@@ -129,6 +138,7 @@ def run_publish():
     log(f"Hero images: {hero_count}")
     log(f"Index patched: {index_patched}")
     log(f"Styles patched: {styles_patched}")
+    _LOG_FP.flush()
     
     return result
 